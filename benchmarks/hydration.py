@@ -0,0 +1,80 @@
+"""
+比较从数据库行创建model实例的两种方式:
+    kwargs:  cls(**kwargs) 经过 Model.__init__
+    hydrate: get_hydrator() 直接设置 __dict__
+
+python benchmarks/hydration.py --rows 200000
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ormlite import configuration
+from ormlite.db.utils import create_tables
+from ormlite.query import get_object_converter
+from benchmarks.models import BenchUser,make_users
+
+
+def kwargs_converter(cls):
+    #原来的转换方式, 作为对比
+    def converter(row,cursor):
+        result = []
+        cols = [col[0] for col in cursor.description]
+        for values in row:
+            kwargs = {}
+            for k,v in zip(cols,values):
+                kwargs[k] = v
+            obj = cls(**kwargs)
+            obj._snapshot = (cols,values)
+            result.append(obj)
+        return result
+    return converter
+
+
+def fetch():
+    sql, params = BenchUser.object.all().as_sql()
+    with configuration.db as connection:
+        cursor = connection.cursor()
+        cursor.execute(sql)
+        return cursor.fetchall(), cursor
+
+
+def measure(converter,row,cursor,repeat):
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = converter(row,cursor)
+        elapsed = time.perf_counter() - start
+        del result
+        best = elapsed if best is None else min(best,elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows",type=int,default=200000)
+    parser.add_argument("--repeat",type=int,default=3)
+    args = parser.parse_args()
+
+    configuration.conf_db({"ENGINE":"ormlite.db.sqlite3","NAME":":memory:"})
+    create_tables([BenchUser],configuration.db)
+    BenchUser.object.bulk_create(make_users(args.rows))
+    row, cursor = fetch()
+
+    results = [
+        ("kwargs", measure(kwargs_converter(BenchUser),row,cursor,args.repeat)),
+        ("hydrate", measure(get_object_converter(BenchUser),row,cursor,args.repeat)),
+    ]
+    base = results[0][1]
+    print("%-10s %12s %14s %8s" % ("path","seconds","rows/sec","speedup"))
+    for name,elapsed in results:
+        print("%-10s %12.4f %14.0f %7.2fx" % (name,elapsed,len(row) / elapsed,base / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import datetime
+import ormlite
+
+
+class BenchUser(ormlite.Model):
+    id = ormlite.PrimaryKey()
+    name = ormlite.CharField(max_length=50)
+    sex = ormlite.CharField(max_length=1)
+    age = ormlite.IntegerField(default=0)
+    birthday = ormlite.DateField()
+
+
+class BenchGoods(ormlite.Model):
+    id = ormlite.PrimaryKey()
+    name = ormlite.CharField(max_length=100)
+    price = ormlite.FloatField(default=0.0)
+
+
+class BenchOrder(ormlite.Model):
+    id = ormlite.PrimaryKey()
+    user = ormlite.ForeignKey(BenchUser,on_delete=ormlite.CASCADE)
+    goods = ormlite.ForeignKey(BenchGoods,on_delete=ormlite.CASCADE)
+    amount = ormlite.IntegerField(default=0)
+    total = ormlite.FloatField(default=0.0)
+
+
+MODELS = [BenchUser,BenchGoods,BenchOrder]
+
+BIRTHDAY = datetime.date(2000,1,1)
+
+
+def make_users(count,start=0):
+    return [BenchUser(name="user%d" % i,sex="MF"[i % 2],age=i % 90,birthday=BIRTHDAY)
+            for i in range(start,start + count)]
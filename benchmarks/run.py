@@ -0,0 +1,369 @@
+"""
+ORMlite 热点路径的基准测试, 使用 sqlite3 (文件数据库和 :memory:)
+
+    python benchmarks/run.py                         #运行全部
+    python benchmarks/run.py --backend memory -k get #只运行名字包含 get 的测试
+    python benchmarks/run.py --save baseline.json    #保存结果作为基线
+    python benchmarks/run.py --compare baseline.json #和基线比较, ops/sec 下降超过阈值时返回1
+
+每个测试报告 ops/sec, 单次操作的延迟百分位(p50/p95/p99)和峰值内存(tracemalloc)
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ormlite import configuration,Session,Sum
+from ormlite.compiler import Compiler
+from ormlite.db.utils import create_tables
+from ormlite.query import Where,get_object_converter
+from ormlite.utils import encode_cursor
+from benchmarks.models import MODELS,BenchUser,BenchGoods,BenchOrder,make_users
+
+
+USERS = 100000
+GOODS = 100
+ORDERS = 10000
+
+BENCHMARKS = []
+
+
+def benchmark(name,number=1000,rows=1):
+    """
+    注册一个测试, 被装饰的函数接收 context 并返回执行一次操作的函数
+    :param number: 测量的操作次数
+    :param rows: 每次操作处理的行数, 用于计算 rows/sec
+    """
+    def decorator(func):
+        BENCHMARKS.append((name,number,rows,func))
+        return func
+    return decorator
+
+
+class Context(object):
+
+    def __init__(self,backend,quick=False):
+        self.backend = backend
+        self.scale = 10 if quick else 1
+        self.random = random.Random(42)
+        self.path = None
+
+    def setup(self):
+        if self.backend == "memory":
+            name = ":memory:"
+        else:
+            fd, self.path = tempfile.mkstemp(suffix=".sqlite3")
+            os.close(fd)
+            os.remove(self.path)
+            name = self.path
+        configuration.conf_db({"ENGINE":"ormlite.db.sqlite3","NAME":name})
+        configuration.debug = False
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_tables(MODELS,configuration.db)
+        self.users = USERS // self.scale
+        BenchUser.object.bulk_create(make_users(self.users))
+        BenchGoods.object.bulk_create(BenchGoods(name="goods%d" % i,price=float(i)) for i in range(GOODS))
+        orders = []
+        for i in range(ORDERS // self.scale):
+            order = BenchOrder(amount=1,total=1.0)
+            order.user_id = i % self.users + 1
+            order.goods_id = i % GOODS + 1
+            orders.append(order)
+        BenchOrder.object.bulk_create(orders)
+
+    def teardown(self):
+        configuration.db.close()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def random_pk(self):
+        return self.random.randint(1,self.users)
+
+    def fetch_rows(self,count):
+        query = BenchUser.object.all()
+        query._limit = slice(0,count)
+        sql, params = query.as_sql()
+        with configuration.db as connection:
+            cursor = connection.cursor()
+            cursor.execute(sql)
+            return cursor.fetchall(), cursor
+
+
+@benchmark("insert_single",number=500)
+def insert_single(ctx):
+    users = iter(make_users(500 * 20,start=10 ** 7))
+    def run():
+        next(users).save()
+    return run
+
+
+@benchmark("insert_bulk_500",number=40,rows=500)
+def insert_bulk(ctx):
+    batches = iter([make_users(500,start=2 * 10 ** 7 + i * 500) for i in range(40 * 20)])
+    def run():
+        BenchUser.object.bulk_create(next(batches))
+    return run
+
+
+@benchmark("get_pk",number=2000)
+def get_pk(ctx):
+    def run():
+        BenchUser.object.get(id=ctx.random_pk())
+    return run
+
+
+@benchmark("filter_scan_1000",number=50,rows=1000)
+def filter_scan(ctx):
+    def run():
+        start = ctx.random.randint(0,ctx.users - 1000)
+        list(BenchUser.object.query(id__gt=start,id__le=start + 1000,age__ge=0))
+    return run
+
+
+@benchmark("values_1000",number=100,rows=1000)
+def values(ctx):
+    def run():
+        list(BenchUser.object.all().values("name","age")[0:1000])
+    return run
+
+
+@benchmark("items_flat_1000",number=100,rows=1000)
+def items_flat(ctx):
+    def run():
+        list(BenchUser.object.all().items("id",flat=True)[0:1000])
+    return run
+
+
+@benchmark("hydrate_10k",number=20,rows=10000)
+def hydrate_10k(ctx):
+    row, cursor = ctx.fetch_rows(10000)
+    converter = get_object_converter(BenchUser)
+    def run():
+        converter(row,cursor)
+    #--quick 时数据量不足
+    run.rows = len(row)
+    return run
+
+
+@benchmark("hydrate_100k",number=5,rows=100000)
+def hydrate_100k(ctx):
+    row, cursor = ctx.fetch_rows(100000)
+    converter = get_object_converter(BenchUser)
+    def run():
+        converter(row,cursor)
+    #--quick 时数据量不足
+    run.rows = len(row)
+    return run
+
+
+@benchmark("fk_traversal_100",number=20,rows=100)
+def fk_traversal(ctx):
+    def run():
+        for order in BenchOrder.object.all()[0:100]:
+            order.user
+            order.goods
+    return run
+
+
+@benchmark("page_offset_deep_100",number=50,rows=100)
+def page_offset_deep(ctx):
+    def run():
+        start = ctx.users - 200
+        list(BenchUser.object.all().sort("id")[start:start + 100])
+    return run
+
+
+@benchmark("page_keyset_deep_100",number=50,rows=100)
+def page_keyset_deep(ctx):
+    #和 page_offset_deep_100 读取同一页
+    cursor = encode_cursor(["id"],[ctx.users - 200])
+    def run():
+        BenchUser.object.all().sort("id").after(cursor).page(100)
+    return run
+
+
+@benchmark("catalog_100",number=500,rows=100)
+def catalog(ctx):
+    def run():
+        list(BenchGoods.object.query(price__ge=0))
+    return run
+
+
+@benchmark("catalog_100_cached",number=500,rows=100)
+def catalog_cached(ctx):
+    def run():
+        list(BenchGoods.object.query(price__ge=0).cached(60))
+    return run
+
+
+def shared_orders():
+    #100 个订单只关联 3 个商品
+    return BenchOrder.object.query(goods_id__in=[1,2,3])[0:100]
+
+
+@benchmark("fk_shared_100",number=20,rows=100)
+def fk_shared(ctx):
+    def run():
+        for order in shared_orders():
+            order.goods
+    return run
+
+
+@benchmark("fk_shared_100_session",number=20,rows=100)
+def fk_shared_session(ctx):
+    def run():
+        with Session():
+            for order in shared_orders():
+                order.goods
+    return run
+
+
+@benchmark("rollup_python",number=20,rows=GOODS)
+def rollup_python(ctx):
+    #读取所有订单在 Python 中按商品汇总
+    def run():
+        totals = {}
+        for goods_id,total in BenchOrder.object.all().items("goods","total"):
+            totals[goods_id] = totals.get(goods_id,0.0) + total
+    return run
+
+
+@benchmark("rollup_db",number=20,rows=GOODS)
+def rollup_db(ctx):
+    #和 rollup_python 相同的汇总, 在数据库中 GROUP BY
+    def run():
+        list(BenchOrder.object.all().group("goods").annotate(total=Sum("total")))
+    return run
+
+
+def compile_query(ctx):
+    where = (Where({"age__ge":18,"sex":"F"}) | Where({"id__in":[1,2,3,4,5]})) & ~Where({"name__like":"a%"})
+    query = BenchUser.object.all().sort("-id","age")
+    query._where = query._where & where
+    query._limit = slice(10,30)
+    return query
+
+
+@benchmark("compile_where",number=20000)
+def compile_where(ctx):
+    compiler = Compiler(configuration.db,cache_size=0)
+    query = compile_query(ctx)
+    def run():
+        compiler.compile(query)
+    return run
+
+
+@benchmark("compile_where_cached",number=20000)
+def compile_where_cached(ctx):
+    compiler = Compiler(configuration.db)
+    query = compile_query(ctx)
+    def run():
+        compiler.compile(query)
+    return run
+
+
+def percentile(values,p):
+    index = min(int(round(p / 100.0 * (len(values) - 1))),len(values) - 1)
+    return values[index]
+
+
+def measure(ctx,number,rows,func):
+    run = func(ctx)
+    rows = getattr(run,"rows",rows)
+    number = max(number // ctx.scale,3)
+    run()
+    gc.collect()
+    timings = []
+    for _ in range(number):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    total = sum(timings)
+    tracemalloc.start()
+    for _ in range(min(number,5)):
+        run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "ops": number,
+        "ops_per_sec": number / total,
+        "rows_per_sec": number * rows / total,
+        "p50_ms": percentile(timings,50) * 1000,
+        "p95_ms": percentile(timings,95) * 1000,
+        "p99_ms": percentile(timings,99) * 1000,
+        "peak_kib": peak / 1024.0,
+    }
+
+
+def run_backend(backend,keyword=None,quick=False):
+    ctx = Context(backend,quick)
+    ctx.setup()
+    results = {}
+    try:
+        for name,number,rows,func in BENCHMARKS:
+            if keyword and keyword not in name:
+                continue
+            results["%s.%s" % (backend,name)] = measure(ctx,number,rows,func)
+    finally:
+        ctx.teardown()
+    return results
+
+
+def report(results,baseline=None,threshold=10.0):
+    regressions = []
+    header = "%-32s %12s %14s %9s %9s %9s %11s" % ("benchmark","ops/sec","rows/sec","p50 ms","p95 ms","p99 ms","peak KiB")
+    if baseline:
+        header += " %9s" % "change"
+    print(header)
+    print("-" * len(header))
+    for name,r in results.items():
+        line = "%-32s %12.1f %14.1f %9.3f %9.3f %9.3f %11.1f" % (name,r["ops_per_sec"],r["rows_per_sec"],
+                    r["p50_ms"],r["p95_ms"],r["p99_ms"],r["peak_kib"])
+        if baseline and name in baseline:
+            change = (r["ops_per_sec"] / baseline[name]["ops_per_sec"] - 1) * 100
+            line += " %+8.1f%%" % change
+            if change < -threshold:
+                line += "  REGRESSION"
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend",choices=["memory","file","all"],default="all")
+    parser.add_argument("-k","--keyword",help="only run benchmarks whose name contains KEYWORD")
+    parser.add_argument("--quick",action="store_true",help="use 1/10 of the data and iterations")
+    parser.add_argument("--save",metavar="FILE",help="save results as JSON")
+    parser.add_argument("--compare",metavar="FILE",help="compare with results saved by --save")
+    parser.add_argument("--threshold",type=float,default=10.0,help="regression threshold in percent")
+    args = parser.parse_args()
+
+    backends = ["memory","file"] if args.backend == "all" else [args.backend]
+    results = {}
+    for backend in backends:
+        results.update(run_backend(backend,args.keyword,args.quick))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    regressions = report(results,baseline,args.threshold)
+    if args.save:
+        with open(args.save,"w") as f:
+            json.dump(results,f,indent=2,sort_keys=True)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
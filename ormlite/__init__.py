@@ -1,5 +1,7 @@
 from ormlite.base import configuration
 from ormlite.fields import *
 from ormlite.model import Model
+from ormlite.expressions import F,OuterRef,Exists,Min,Max,Sum,Count,Avg
+from ormlite.session import Session
 
 version = "1.0"
@@ -0,0 +1,74 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from ormlite.base import configuration
+
+
+_DONE = object()
+
+
+def run_in_executor(func,*args,**kwargs):
+    """
+    在ORM的工作线程中执行同步函数, 返回可以 await 的 Future
+    每个工作线程从连接池取得自己的连接, 不会阻塞事件循环
+    在调用者的 contextvars 上下文中执行, 工作线程可以使用当前的 Session
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return loop.run_in_executor(configuration.get_executor(),functools.partial(context.run,func,*args,**kwargs))
+
+
+async def iterate(query,chunk_size=2000):
+    #在单独的线程中用 Query.iterator 读取, 每块结果通过队列交给事件循环
+    #读取线程不占用工作线程, 循环中 await 的其它查询仍然可以在工作线程中执行
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=2)
+    stop = threading.Event()
+    done = loop.create_future()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item),loop).result()
+
+    def produce():
+        try:
+            chunk = []
+            for obj in query.iterator(chunk_size):
+                chunk.append(obj)
+                if len(chunk) >= chunk_size:
+                    if stop.is_set():
+                        return
+                    put(chunk)
+                    chunk = []
+            if chunk and not stop.is_set():
+                put(chunk)
+        except Exception as e:
+            if not stop.is_set():
+                put(e)
+            return
+        if not stop.is_set():
+            put(_DONE)
+
+    def run(context):
+        try:
+            context.run(produce)
+        finally:
+            loop.call_soon_threadsafe(done.set_result,None)
+
+    thread = threading.Thread(target=run,args=(contextvars.copy_context(),),name="ormlite-iterate",daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item,Exception):
+                raise item
+            for obj in item:
+                yield obj
+    finally:
+        stop.set()
+        #生产者可能正在等待放入队列
+        while not queue.empty():
+            queue.get_nowait()
+        await done
@@ -1,7 +1,11 @@
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from importlib import import_module
 from ormlite.exception import ORMLiteException
 from ormlite.compiler import Compiler
+from ormlite.instrument import Instrumentation
+from ormlite.cache import LocalCache
 
 class Configuration(object):
 
@@ -12,6 +16,12 @@ class Configuration(object):
         self.compiler = None
         self.logger = None
         self._debug = False
+        self._debug_listener = None
+        self.instrument = Instrumentation()
+        self.executor = None
+        self._executor_lock = threading.Lock()
+        #查询结果缓存, 第一次使用时默认创建 LocalCache
+        self.cache = None
         self.models = {}
 
     def conf_db(self,config):
@@ -20,7 +30,27 @@ class Configuration(object):
         self.db_config = config
         self.db_engine = import_module(config["ENGINE"])
         self.db = self.db_engine.Database(config)
-        self.compiler = Compiler(self.db)
+        self.compiler = Compiler(self.db,cache_size=config.get("SQL_CACHE_SIZE",256))
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def get_executor(self):
+        #异步接口使用的工作线程, 数量和连接池的最大连接数相同
+        with self._executor_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.db.pool.max_size,
+                                                   thread_name_prefix="ormlite")
+            return self.executor
+
+    def set_cache(self,cache):
+        #cache 为 BaseCache 的实现
+        self.cache = cache
+
+    def get_cache(self):
+        if self.cache is None:
+            self.cache = LocalCache()
+        return self.cache
 
     def set_logger(self,logger):
         self.logger = logger
@@ -34,6 +64,20 @@ class Configuration(object):
         self._debug = value
         if self._debug and not self.logger:
             self.logger = logging
+        if self._debug and self._debug_listener is None:
+            self._debug_listener = self.instrument.connect(before=self._log_query)
+        elif not self._debug and self._debug_listener is not None:
+            self.instrument.disconnect(self._debug_listener)
+            self._debug_listener = None
+
+    def _log_query(self,event):
+        self.logger.debug(event.formatted_sql)
+
+    def start_query(self,obj):
+        #没有注册回调时返回None
+        if self.instrument.enabled:
+            return self.instrument.start(obj,self.db.placeholder)
+        return None
 
     def register_model(self,model):
         key = "%s.%s" % (model.__module__, model._opts.model_name)
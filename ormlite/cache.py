@@ -0,0 +1,103 @@
+import hashlib
+import threading
+import time
+import uuid
+from ormlite.utils import LRUCache
+
+
+class CachedCursor(object):
+    #缓存命中时代替游标传给 converter, converter 只使用 description
+
+    def __init__(self,description):
+        self.description = description
+
+
+class BaseCache(object):
+    """
+    查询结果缓存的接口, 外部缓存(redis, memcached等)实现 get/set/delete/clear 即可
+    key 中包含查询涉及的 model 的版本号, 写入 model 时更换版本号, 旧的条目不会再被读取, 由 TTL 淘汰
+        configuration.set_cache(RedisCache(...))
+    """
+
+    key_prefix = "ormlite"
+
+    def get(self,key):
+        #不存在或已过期时返回 None
+        raise NotImplementedError
+
+    def set(self,key,value,ttl=None):
+        raise NotImplementedError
+
+    def delete(self,key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def get_version_key(self,model):
+        return "%s:version:%s.%s" % (self.key_prefix,model.__module__,model._opts.model_name)
+
+    def get_version(self,model):
+        #版本号被淘汰后生成新的版本号, 不会重新读到旧的条目
+        key = self.get_version_key(model)
+        version = self.get(key)
+        if version is None:
+            version = uuid.uuid4().hex
+            self.set(key,version)
+        return version
+
+    def invalidate(self,model):
+        self.set(self.get_version_key(model),uuid.uuid4().hex)
+
+    def make_key(self,models,sql,params):
+        versions = [self.get_version(model) for model in models]
+        digest = hashlib.sha1(repr((sql,params,versions)).encode("utf-8")).hexdigest()
+        return "%s:query:%s" % (self.key_prefix,digest)
+
+
+class LocalCache(BaseCache):
+    """
+    进程内的 LRU + TTL 缓存, 线程安全
+    :param maxsize: 最多缓存的查询数, 超出后淘汰最久未使用的查询
+    """
+
+    def __init__(self,maxsize=1024):
+        self._data = LRUCache(maxsize)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self,key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires,value = item
+        if expires is not None and expires < time.monotonic():
+            self._data.delete(key)
+            return None
+        return value
+
+    def set(self,key,value,ttl=None):
+        expires = time.monotonic() + ttl if ttl else None
+        self._data.set(key,(expires,value))
+
+    def delete(self,key):
+        self._data.delete(key)
+
+    def clear(self):
+        self._data.clear()
+
+    def get_version(self,model):
+        return self._versions.get(model,0)
+
+    def invalidate(self,model):
+        with self._lock:
+            self._versions[model] = self._versions.get(model,0) + 1
+
+    def make_key(self,models,sql,params):
+        return (sql,params,tuple(self.get_version(model) for model in models))
+
+    def info(self):
+        return self._data.info()
+
+    def __repr__(self):
+        return "<LocalCache size:%s maxsize:%s>" % (len(self._data),self._data.maxsize)
@@ -1,5 +1,8 @@
 import datetime
+from collections import OrderedDict
 from ormlite.exception import CompileError
+from ormlite.utils import LRUCache
+from ormlite.expressions import Expression,F,Value,CombinedExpression,OuterRef,Exists,Aggregate
 
 
 # def get_compiler():
@@ -7,9 +10,43 @@ from ormlite.exception import CompileError
 #     return Compiler(db)
 
 
+class Joins(object):
+    """
+    查询需要连接的关联表, 同一条外键路径只连接一次
+    别名为 "<表名>__<外键路径>", 例如 Order__user__company
+    聚合可以经过反向关联连接, 例如 User__order_set, 连接条件为 关联表的外键 = 主键
+    """
+
+    def __init__(self,model):
+        self.model = model
+        self.table = model._opts.model_name
+        #path: (field,related_model,alias,parent_alias,join_type,reverse)
+        self.joins = OrderedDict()
+        #有连接时主表的列需要带表名
+        self.qualify = False
+        #子查询中为外层查询的 Joins, OuterRef 引用外层的表
+        self.outer = None
+        #查询的别名(聚合等), 在 HAVING 和 ORDER BY 中直接引用, 不带表名
+        self.aliases = ()
+
+    def add(self,path,field,rel_model,parent,join_type="INNER",reverse=False):
+        join = self.joins.get(path)
+        if join is None:
+            join = (field,rel_model,"%s__%s" % (self.table,"__".join(path)),parent,join_type,reverse)
+            self.joins[path] = join
+        elif join_type == "INNER" and join[4] == "LEFT":
+            #必须满足的条件也引用了这个连接
+            join = join[:4] + ("INNER",) + join[5:]
+            self.joins[path] = join
+        return join[2]
+
+    def __bool__(self):
+        return bool(self.joins)
+
+
 class Compiler(object):
 
-    def __init__(self,db):
+    def __init__(self,db,cache_size=256):
         self.db = db
         self.operators = db.operators
         self.placeholder = db.placeholder
@@ -17,30 +54,379 @@ class Compiler(object):
             "UPDATE":self._compile_update,
             "SELECT":self._compile_select,
             "INSERT":self._compile_insert,
+            "BULK_INSERT":self._compile_bulk_insert,
+            "BULK_UPSERT":self._compile_bulk_upsert,
+            "BULK_UPDATE":self._compile_bulk_update,
             "DELETE":self._compile_delete,
+            "GROUP_COUNT":self._compile_group_count,
             "WHERE":self._compile_where
         }
+        #SQL文本只取决于查询的结构, 以结构为key缓存编译后的SQL, 命中时只需要重新收集参数
+        self.cache = LRUCache(cache_size)
+        self.cache_keys = {
+            "UPDATE":self._update_key,
+            "SELECT":self._select_key,
+            "DELETE":self._delete_key,
+            "GROUP_COUNT":self._group_count_key,
+        }
 
     def compile(self,obj):
         statement = getattr(obj,"statement",None)
         _compile = self.mappings.get(statement,None)
         if _compile:
-            return _compile(obj)
+            get_key = self.cache_keys.get(statement,None)
+            if get_key is None or self.cache.maxsize <= 0:
+                return _compile(obj)
+            key = get_key(obj)
+            if key is None:
+                return _compile(obj)
+            key,params = key
+            sql = self.cache.get(key)
+            if sql is None:
+                sql,params = _compile(obj)
+                self.cache.set(key,sql)
+            return sql,tuple(params)
         elif hasattr(obj, "as_sql"):
             return obj.as_sql()
         else:
             raise CompileError("Objects that cannot be compiled:%s" % obj)
 
-    def _compile_condition(self,conditions):
+    def cache_info(self):
+        return self.cache.info()
+
+    def cache_clear(self):
+        self.cache.clear()
+
+    def _expression_key(self,expression,params):
+        if isinstance(expression,OuterRef):
+            return ("OuterRef",expression.name)
+        elif isinstance(expression,F):
+            return ("F",expression.name)
+        elif isinstance(expression,Aggregate):
+            return (expression.function,expression.distinct,self._expression_key(expression.expression,params))
+        elif isinstance(expression,CombinedExpression):
+            lhs = self._expression_key(expression.lhs,params)
+            rhs = self._expression_key(expression.rhs,params)
+            return (lhs,expression.operator,rhs)
+        params.append(expression.value)
+        return "Value"
+
+    def _condition_key(self,conditions,params,aliases=None):
+        key = []
+        for k,v in conditions.items():
+            symbol = self.get_lookup_symbol(k.split("__"))
+            v = self.adapt_value(v)
+            expression = self.get_alias_expression(k,aliases)
+            if expression is not None:
+                self._expression_key(expression,params)
+            if isinstance(v,Expression):
+                key.append((k,self._expression_key(v,params)))
+            elif self.is_query(v):
+                subquery_key,subquery_params = self._select_key(self.get_subquery(v))
+                key.append((k,subquery_key))
+                params.extend(subquery_params)
+            elif symbol == "in":
+                key.append((k,len(v)))
+                params.extend(v)
+            elif symbol == "range":
+                key.append(k)
+                params.extend(v)
+            else:
+                key.append(k)
+                params.append(v)
+        return tuple(key)
+
+    def _where_key(self,where,params,aliases=None):
+        #返回where的结构, 同时按编译时的顺序收集参数
+        key = []
+        for node in where.buf:
+            if isinstance(node, where.__class__):
+                key.append(self._where_key(node,params,aliases))
+            elif isinstance(node, dict):
+                key.append(self._condition_key(node,params,aliases))
+            elif isinstance(node, Exists):
+                subquery_key,subquery_params = self._select_key(self.get_subquery(node.query,exists=True))
+                key.append(("EXISTS",subquery_key))
+                params.extend(subquery_params)
+            else:
+                key.append(node)
+        return tuple(key)
+
+    def _select_key(self,query):
+        params = []
+        #参数的顺序: 查询的列, WHERE, keyset, HAVING
+        alias = []
+        for name in self.get_alias_order(query):
+            value = query._alias[name]
+            if isinstance(value,Expression):
+                value = self._expression_key(value,params)
+            alias.append((name,value))
+        where = self._where_key(query._where,params,query._alias) if query._where else None
+        limit = query._limit
+        if isinstance(limit,slice):
+            limit = (limit.start,limit.stop)
+        after = None
+        if query._after is not None:
+            after = tuple(query._after[0])
+            params.extend(self._keyset_params(*query._after))
+        having = self._where_key(query._having,params,query._alias) if query._having else None
+        key = ("SELECT", query.model, tuple(query._fields), tuple(alias), query._distinct,
+               tuple(query._select_related), where, after, tuple(query._groupby), having, tuple(query._orderby), limit)
+        return key,params
+
+    def _update_key(self,update):
+        if update.instance or not update.update_fields:
+            return None
+        params = []
+        values = []
+        for value in update.update_fields.values():
+            if isinstance(value,Expression):
+                values.append(self._expression_key(value,params))
+            else:
+                values.append(None)
+                params.append(value)
+        where = self._where_key(update.where,params) if update.where else None
+        key = ("UPDATE", update.model, tuple(update.update_fields), tuple(values), where)
+        return key,params
+
+    def _delete_key(self,delete):
+        if delete.instance or not delete.where:
+            return None
+        params = []
+        where = self._where_key(delete.where,params)
+        key = ("DELETE", delete.model, where)
+        return key,params
+
+    def _group_count_key(self,count):
+        key,params = self._select_key(count.query)
+        return ("GROUP_COUNT",key),params
+
+    def get_lookup_symbol(self,parts):
+        #key 的最后一部分是操作符时返回操作符, 否则为 eq; pk/id 作为字段名
+        if len(parts) > 1 and parts[-1] in self.operators and parts[-1] not in ("pk","id"):
+            return parts[-1]
+        return "eq"
+
+    def get_alias_order(self,query):
+        #编译的顺序: 在 items()/values() 中列出的别名按列出的位置, 其余的别名在字段之后
+        names = [name for name in query._fields if name in query._alias]
+        names.extend(name for name in query._alias if name not in names)
+        return names
+
+    def get_alias_expression(self,key,aliases):
+        #条件引用的别名是表达式时返回表达式, HAVING 中直接使用表达式, 避免和同名的列混淆
+        if not aliases:
+            return None
+        parts = key.split("__")
+        symbol = self.get_lookup_symbol(parts)
+        if symbol != "eq" or parts[-1] == "eq":
+            parts = parts[:-1]
+        if len(parts) == 1 and isinstance(aliases.get(parts[0]),Expression):
+            return aliases[parts[0]]
+        return None
+
+    def is_query(self,value):
+        return getattr(value,"statement",None) == "SELECT"
+
+    def get_subquery(self,query,exists=False):
+        #IN 的子查询只能查询一列, 没有指定时查询主键; EXISTS 的子查询只查询 1
+        subquery = query.copy()
+        subquery._select_related = []
+        subquery._prefetch_related = []
+        if exists:
+            subquery._fields = []
+            if not subquery._having:
+                subquery._alias = {}
+            if subquery._limit is None:
+                subquery._orderby = []
+        elif len(subquery._fields) + len(subquery._alias) != 1:
+            subquery._fields = [subquery.model.get_pk_name()]
+            subquery._alias = {}
+        return subquery
+
+    def adapt_value(self,value):
+        #model实例作为外键的值
+        if hasattr(value,"_opts"):
+            return value.pk
+        return value
+
+    def resolve_lookup(self,key,joins=None,join_type="LEFT"):
+        """
+        解析查询条件的key, 返回 (列, 操作符)
+        user__name__like: 通过外键 user 连接 User 表, 比较 User 的 name 列, 连接加入 joins
+        join_type: 新加入的连接的类型, 为 INNER 时把已有的 LEFT JOIN 改为 INNER JOIN
+        user__id: 只比较外键的值, 不需要连接
+        """
+        parts = key.split("__")
+        symbol = self.get_lookup_symbol(parts)
+        if symbol != "eq" or parts[-1] == "eq":
+            parts = parts[:-1]
+        if joins is None:
+            return self.quote(parts[0]),symbol
+        if len(parts) == 1 and parts[0] in joins.aliases:
+            return self.quote(parts[0]),symbol
+        model = joins.model
+        parent = joins.table
+        alias = parent if joins.qualify else None
+        path = []
+        for i,name in enumerate(parts):
+            opts = model._opts
+            field = opts.pk_field if name == "pk" else opts.get_field(name) or opts.get_column_field(name)
+            if field is None:
+                if i == 0 and len(parts) == 1:
+                    #不是字段的列名, 例如聚合的别名
+                    return self.quote_column(name,alias),symbol
+                raise CompileError("%s has no field '%s'" % (model.__name__,name))
+            if i == len(parts) - 1:
+                return self.quote_column(field.get_column(),alias),symbol
+            if not field.is_related:
+                raise CompileError("'%s.%s' is not a related field" % (model.__name__,name))
+            rel_field = field.get_related_field()
+            if i == len(parts) - 2 and parts[-1] in ("pk",rel_field.name):
+                return self.quote_column(field.get_column(),alias),symbol
+            path.append(field.name)
+            parent = alias = joins.add(tuple(path),field,field.get_related_model(),parent,join_type)
+            model = field.get_related_model()
+
+    def resolve_field(self,name,joins):
+        """
+        解析表达式中的字段路径, 返回列
+        可以跨外键和反向关联, 使用 LEFT JOIN 保留没有关联行的记录; 以关联结束时返回关联表的主键
+        """
+        if name == "*":
+            return name
+        parts = name.split("__")
+        model = joins.model
+        parent = joins.table
+        alias = parent if joins.qualify else None
+        path = []
+        for i,part in enumerate(parts):
+            opts = model._opts
+            field = opts.reverse_related.get(part)
+            reverse = field is not None
+            if reverse:
+                rel_model = field.model
+            else:
+                field = opts.pk_field if part == "pk" else opts.get_field(part) or opts.get_column_field(part)
+                if field is None:
+                    if i == 0 and len(parts) == 1:
+                        return self.quote_column(part,alias)
+                    raise CompileError("%s has no field '%s'" % (model.__name__,part))
+                if i == len(parts) - 1:
+                    return self.quote_column(field.get_column(),alias)
+                if not field.is_related:
+                    raise CompileError("'%s.%s' is not a related field" % (model.__name__,part))
+                if i == len(parts) - 2 and parts[-1] in ("pk",field.get_related_field().name):
+                    return self.quote_column(field.get_column(),alias)
+                rel_model = field.get_related_model()
+            path.append(part)
+            parent = alias = joins.add(tuple(path),field,rel_model,parent,"LEFT",reverse)
+            model = rel_model
+        return self.quote_column(model._opts.pk_field.get_column(),alias)
+
+    def get_joins(self,model,where=None,select_related=(),expressions=()):
+        joins = Joins(model)
+        for name in select_related:
+            field = model._opts.get_field(name)
+            if field is None or not field.is_related:
+                raise CompileError("%s has no related field '%s'" % (model, name))
+            joins.add((field.name,),field,field.get_related_model(),joins.table,"LEFT")
+        if where:
+            self.collect_joins(where,joins)
+        for expression in expressions:
+            self.collect_expression_joins(expression,joins)
+        joins.qualify = bool(joins)
+        return joins
+
+    def get_models(self,query):
+        #查询涉及的所有 model, 包括连接的表和子查询, 用于查询结果缓存的失效
+        joins = self.get_joins(query.model,query._where,query._select_related,query._alias.values())
+        models = [query.model]
+        models.extend(join[1] for join in joins.joins.values())
+        for subquery in self.get_subqueries(query._where):
+            models.extend(self.get_models(subquery))
+        return models
+
+    def get_subqueries(self,where):
+        for node in where.buf:
+            if isinstance(node, where.__class__):
+                for subquery in self.get_subqueries(node):
+                    yield subquery
+            elif isinstance(node, Exists):
+                yield node.query
+            elif isinstance(node, dict):
+                for value in node.values():
+                    if self.is_query(value):
+                        yield value
+
+    def collect_joins(self,where,joins,required=True):
+        #只有最外层 AND 中的条件使用 INNER JOIN, OR/NOT 中的条件使用 LEFT JOIN, 否则会丢掉外键为 NULL 的行
+        required = required and not any(isinstance(node,str) and node in (" OR ","NOT ") for node in where.buf)
+        for node in where.buf:
+            if isinstance(node, where.__class__):
+                self.collect_joins(node,joins,required)
+            elif isinstance(node, dict):
+                for key in node:
+                    self.resolve_lookup(key,joins,"INNER" if required else "LEFT")
+
+    def collect_expression_joins(self,expression,joins):
+        #查询的列中的表达式(例如聚合)需要的连接
+        if isinstance(expression,Aggregate):
+            self.collect_expression_joins(expression.expression,joins)
+        elif isinstance(expression,CombinedExpression):
+            self.collect_expression_joins(expression.lhs,joins)
+            self.collect_expression_joins(expression.rhs,joins)
+        elif isinstance(expression,F) and not isinstance(expression,OuterRef):
+            self.resolve_field(expression.name,joins)
+
+    def _compile_joins(self,joins):
+        sql = []
+        for field,rel_model,alias,parent,join_type,reverse in joins.joins.values():
+            if reverse:
+                #反向关联: 关联表的外键 = 上一个表被引用的列
+                on = (self.quote_column(field.get_column(),alias),
+                      self.quote_column(field.get_related_field().get_column(),parent))
+            else:
+                on = (self.quote_column(field.get_related_field().get_column(),alias),
+                      self.quote_column(field.get_column(),parent))
+            sql.append("%s JOIN `%s` AS %s ON %s = %s" % ((join_type, rel_model._opts.model_name, self.quote(alias)) + on))
+        return " ".join(sql)
+
+    def _compile_statement_where(self,model,where):
+        #UPDATE/DELETE 需要连接其它表时改为 主键 IN (子查询), mysql 不能直接在子查询中读取被修改的表
+        joins = self.get_joins(model,where)
+        where_sql,where_params = self._compile_where(where,joins)
+        if not joins:
+            return where_sql,where_params
+        pk_column = model._opts.pk_field.get_column()
+        sql = "%s IN (SELECT * FROM (SELECT %s FROM `%s` %s WHERE %s) AS `ormlite_subquery`)" % (
+                self.quote(pk_column),self.quote_column(pk_column,joins.table),joins.table,
+                self._compile_joins(joins),where_sql)
+        return sql,where_params
+
+    def _compile_condition(self,conditions,joins=None):
         sql = []
         params = []
+        model = joins.model if joins is not None else None
+        table = joins.table if joins is not None and joins.qualify else None
         for k,v in conditions.items():
-            if k.find("__") > 0:
-                name,symbol = k.split("__")
-            else:
-                name,symbol = k,'eq'
+            column,symbol = self.resolve_lookup(k,joins)
+            expression = self.get_alias_expression(k,joins.aliases if joins is not None else None)
+            if expression is not None:
+                column,expression_params = self.compile_expression(expression,model,table,joins.outer,joins)
+                params.extend(expression_params)
+            v = self.adapt_value(v)
             op = self.operators.get(symbol)
-            if symbol == "in":
+            if isinstance(v,Expression):
+                expression_sql,expression_params = self.compile_expression(v,model,table,joins.outer if joins is not None else None)
+                op = op % expression_sql
+                params.extend(expression_params)
+            elif self.is_query(v):
+                #子查询的参数按位置合并到外层查询的参数中
+                subquery_sql,subquery_params = self._compile_select(self.get_subquery(v),True,joins)
+                op = "IN (%s)" % subquery_sql if symbol == "in" else op % "(%s)" % subquery_sql
+                params.extend(subquery_params)
+            elif symbol == "in":
                 op = op % (",".join([self.placeholder] * len(v)))
                 params.extend(v)
             elif symbol == "range":
@@ -49,33 +435,33 @@ class Compiler(object):
             else:
                 op = op % self.placeholder
                 params.append(v)
-            sql.append("%s %s" % (self.quote(name), op))
+            sql.append("%s %s" % (column, op))
         return " AND ".join(sql),params
 
-    def _compile_where(self,where):
+    def _compile_where(self,where,joins=None):
         sql = []
         params = []
         for node in where.buf:
             if isinstance(node, where.__class__):
-                _sql,_params = self._compile_where(node)
+                _sql,_params = self._compile_where(node,joins)
                 sql.append(_sql)
                 params.extend(_params)
             elif isinstance(node, dict):
-                _sql,_params = self._compile_condition(node)
+                _sql,_params = self._compile_condition(node,joins)
                 sql.append(_sql)
                 params.extend(_params)
+            elif isinstance(node, Exists):
+                _sql,_params = self._compile_select(self.get_subquery(node.query,exists=True),True,joins)
+                sql.append("EXISTS (%s)" % _sql)
+                params.extend(_params)
             else:
                 sql.append(node)
         return "".join(sql),tuple(params)
 
-    def _compile_insert(self,insert):
-        table = insert.table
-        instance = insert.instance
-        fields = instance._opts.fields
+    def _get_insert_values(self,instance):
         columns = []
         params = []
-        placeholders = []
-        for field in fields:
+        for field in instance._opts.fields:
             if field.is_related:
                 obj = getattr(instance,field.name,None)
                 if obj is not None:
@@ -90,10 +476,39 @@ class Compiler(object):
                 value = field.adapt(value)
             columns.append(self.quote(field.get_column()))
             params.append(value)
-            placeholders.append(self.placeholder)
+        return columns,params
+
+    def _compile_insert(self,insert):
+        table = insert.table
+        columns,params = self._get_insert_values(insert.instance)
+        placeholders = [self.placeholder] * len(columns)
         sql = 'INSERT INTO `%s` (%s) VALUES (%s);' % (table, ",".join(columns), ",".join(placeholders))
         return sql,tuple(params)
 
+    def _compile_bulk_insert(self,insert):
+        #多行 VALUES, 每个批次编译成一条语句
+        table = insert.table
+        columns = None
+        params = []
+        values = []
+        for instance in insert.batch:
+            columns,_params = self._get_insert_values(instance)
+            params.extend(_params)
+            values.append("(%s)" % ",".join([self.placeholder] * len(_params)))
+        if not values:
+            raise CompileError("BulkInsert object's 'batch' attribute cannot be empty")
+        sql = 'INSERT INTO `%s` (%s) VALUES %s;' % (table, ",".join(columns), ",".join(values))
+        return sql,tuple(params)
+
+    def _compile_bulk_upsert(self,upsert):
+        sql,params = self._compile_bulk_insert(upsert)
+        opts = upsert.model._opts
+        conflict_columns = [self.quote(opts.get_field(name).get_column()) for name in upsert.conflict_fields]
+        update_columns = [self.quote(opts.get_field(name).get_column()) for name in upsert.update_fields]
+        pk_column = self.quote(opts.pk_field.get_column())
+        clause = self.db.get_upsert_sql(conflict_columns,update_columns,pk_column)
+        return '%s %s;' % (sql[:-1],clause),params
+
     def _compile_delete(self,delete):
         table = delete.table
         instance = delete.instance
@@ -106,10 +521,15 @@ class Compiler(object):
             where = delete.where
         else:
             raise CompileError("Delete object's 'where' attribute cannot be empty")
-        where_sql,where_params = self._compile_where(where)
+        where_sql,where_params = self._compile_statement_where(delete.model,where)
         sql = 'DELETE FROM `%s` WHERE %s' % (table, where_sql)
         return sql,tuple(where_params)
 
+    def _compile_group_count(self,count):
+        #分组的数量, 分组查询作为子查询
+        sql,params = self._compile_select(count.query,True)
+        return "SELECT COUNT(*) FROM (%s) AS `ormlite_subquery` ;" % sql,params
+
     def _compile_update(self,update):
         instance = update.instance
         sql = ['UPDATE `%s` SET' % update.table]
@@ -124,7 +544,10 @@ class Compiler(object):
                     field = update.model._opts.get_field(field_name)
                     column = field.get_column()
                     update_columns[self.quote(column)] = self.placeholder
-                    value = getattr(instance,field_name)
+                    if field.is_related:
+                        value = getattr(instance,column,None)
+                    else:
+                        value = getattr(instance,field_name)
                     params.append(value)
             else:
                 for field in instance._opts.fields:
@@ -145,8 +568,13 @@ class Compiler(object):
         elif update.update_fields:
             for field_name, value in update.update_fields.items():
                 field = update.model._opts.get_field(field_name)
-                update_columns[self.quote(field.get_column())] = self.placeholder
-                params.append(value)
+                if isinstance(value,Expression):
+                    expression_sql,expression_params = self.compile_expression(value,update.model)
+                    update_columns[self.quote(field.get_column())] = expression_sql
+                    params.extend(expression_params)
+                else:
+                    update_columns[self.quote(field.get_column())] = self.placeholder
+                    params.append(value)
         else:
             raise CompileError("No fields need update")
         expressions = ['%s = %s' % (k, v) for k, v in update_columns.items()]
@@ -154,41 +582,85 @@ class Compiler(object):
         where = update.where
         if where:
             sql.append("WHERE")
-            where_sql, where_params = self._compile_where(where)
+            where_sql, where_params = self._compile_statement_where(update.model,where)
             sql.append(where_sql)
             params.extend(where_params)
         sql.append(";")
         sql = " ".join(sql)
         return sql, tuple(params)
 
-    def _compile_select(self,query):
+    def _compile_bulk_update(self,update):
+        #每个字段编译成 CASE 主键 WHEN ? THEN ? ... END
+        batch = update.batch
+        if not batch:
+            raise CompileError("BulkUpdate object's 'batch' attribute cannot be empty")
+        pk_field = update.model.get_pk_field()
+        pk_column = self.quote(pk_field.get_column())
+        params = []
+        expressions = []
+        for field_name in update.fields:
+            field = update.model._opts.get_field(field_name)
+            cases = []
+            for instance in batch:
+                cases.append("WHEN %s THEN %s" % (self.placeholder,self.placeholder))
+                params.append(instance.pk)
+                params.append(field.adapt(getattr(instance,field.get_attname(),None)))
+            expressions.append("%s = CASE %s %s END" % (self.quote(field.get_column()),pk_column," ".join(cases)))
+        params.extend(instance.pk for instance in batch)
+        sql = 'UPDATE `%s` SET %s WHERE %s IN (%s);' % (update.table,", ".join(expressions),pk_column,
+                                                          ",".join([self.placeholder] * len(batch)))
+        return sql,tuple(params)
+
+    def _compile_select(self,query,subquery=False,outer=None):
+        #编译为子查询时不带结尾的分号, outer 为外层查询的 Joins
         sql = ['SELECT']
         params = []
         columns = []
-        aliases = []
+        #select_related 的 LEFT JOIN 和查询条件的 INNER JOIN, 同一条路径共用一个连接
+        joins = self.get_joins(query.model,query._where,query._select_related,query._alias.values())
+        joins.outer = outer
+        joins.aliases = query._alias
+        table = query.table if joins else None
         if query._fields:
             for field_name in query._fields:
                 field = query.model._opts.get_field(field_name)
-                if field:
-                    column = field.get_column()
-                    if field.is_related:
-                        aliases.append(self.alias_column(self.quote(column),self.quote(field.name)))
-                    else:
-                        columns.append(self.quote(column))
+                if field_name in query._alias:
+                    columns.append(self._compile_alias(query,field_name,table,joins,params))
+                elif field:
+                    columns.append(self.quote_column(field.get_column(),table))
                 else:
                     columns.append(self.quote(field_name))
+        for k in query._alias:
+            if k not in query._fields:
+                columns.append(self._compile_alias(query,k,table,joins,params))
+        #select_related 的列排在最后
+        for name in query._select_related:
+            field,rel_model,alias = joins.joins[(name,)][:3]
+            for rel_field in rel_model._opts.fields:
+                column = rel_field.get_column()
+                columns.append(self.alias_column(self.quote_column(column,alias),
+                                                 self.quote("%s__%s" % (field.name,column))))
         if query._distinct:
             sql.append("DISTINCT")
-        if query._alias:
-            aliases.extend(self.alias_column(v,self.quote(k)) for k, v in query._alias.items())
-            columns.extend(aliases)
+        if not columns:
+            #只判断是否存在记录
+            columns.append("1")
         sql.append(', '.join(columns))
         sql.append('FROM `%s`' % query.table)
+        if joins:
+            sql.append(self._compile_joins(joins))
         if query._where:
             sql.append("WHERE")
-            where_sql, where_params = self._compile_where(query._where)
+            where_sql, where_params = self._compile_where(query._where,joins)
+            if query._after is not None:
+                where_sql = "(%s)" % where_sql
             sql.append(where_sql)
             params.extend(where_params)
+        if query._after is not None:
+            sql.append("AND" if query._where else "WHERE")
+            keyset_sql, keyset_params = self._compile_keyset(query,table)
+            sql.append(keyset_sql)
+            params.extend(keyset_params)
         if query._groupby:
             groups = []
             for field_name in query._groupby:
@@ -197,36 +669,125 @@ class Compiler(object):
                     column = field.get_column()
                 else:
                     column = field_name
-                groups.append(self.quote(column))
+                groups.append(self.quote_column(column,table))
             sql.append("GROUP BY %s" % ', '.join(groups))
+        if query._having:
+            sql.append("HAVING")
+            having_sql, having_params = self._compile_where(query._having,joins)
+            sql.append(having_sql)
+            params.extend(having_params)
         if query._orderby:
             orderby = []
             for field_name in query._orderby:
+                desc = field_name.startswith("-")
+                if desc:
+                    field_name = field_name[1:]
                 field = query.model._opts.get_field(field_name)
-                if field:
-                    column = field.get_column()
+                if field_name in query._alias:
+                    column = self.quote(field_name)
+                elif field:
+                    column = self.quote_column(field.get_column(),table)
                 else:
-                    column = field_name
-                if column.startswith("-"):
-                    column = column[1:]
-                    orderby.append("`%s` DESC" % column)
+                    column = self.quote_column(field_name,table)
+                if desc:
+                    orderby.append("%s DESC" % column)
                 else:
-                    orderby.append(self.quote(column))
+                    orderby.append(column)
             sql.append("ORDER BY %s" % ', '.join((f for f in orderby)))
         if query._limit is not None:
             if isinstance(query._limit, slice):
                 start = query._limit.start or 0
-                length = query._limit.stop or -1 # max length
+                stop = query._limit.stop
+                #query[a:b] 取 b-a 行, 不是 b 行
+                length = max(stop - start,0) if stop is not None else -1 # max length
                 sql.append("LIMIT %s OFFSET %s" % (length, start))
             elif isinstance(query._limit, int):
                 sql.append("LIMIT 1 OFFSET %s" % query._limit)
-        sql.append(";")
+        if not subquery:
+            sql.append(";")
         sql = ' '.join(sql)
         return sql, tuple(params)
 
+    def _compile_alias(self,query,name,table,joins,params):
+        value = query._alias[name]
+        if isinstance(value,Expression):
+            value,expression_params = self.compile_expression(value,query.model,table,joins.outer,joins)
+            params.extend(expression_params)
+        return self.alias_column(value,self.quote(name))
+
+    def _compile_keyset(self,query,table=None):
+        #排序方向一致时使用行值比较 (a,b) > (?,?), 否则展开成 a > ? OR (a = ? AND b > ?)
+        orderby,values = query._after
+        if len(orderby) != len(values):
+            raise CompileError("Invalid cursor for ordering %s" % orderby)
+        columns = []
+        operators = []
+        for field_name in orderby:
+            desc = field_name.startswith("-")
+            if desc:
+                field_name = field_name[1:]
+            field = query.model._opts.get_field(field_name)
+            column = field.get_column() if field else field_name
+            columns.append(self.quote_column(column,table))
+            operators.append("<" if desc else ">")
+        params = self._keyset_params(orderby,values)
+        if len(set(operators)) == 1:
+            if len(columns) == 1:
+                return "%s %s %s" % (columns[0],operators[0],self.placeholder),params
+            placeholders = ", ".join([self.placeholder] * len(values))
+            return "(%s) %s (%s)" % (", ".join(columns),operators[0],placeholders),params
+        sql = []
+        for i in range(len(columns)):
+            conditions = ["%s = %s" % (column,self.placeholder) for column in columns[:i]]
+            conditions.append("%s %s %s" % (columns[i],operators[i],self.placeholder))
+            sql.append("(%s)" % " AND ".join(conditions))
+        return "(%s)" % " OR ".join(sql),params
+
+    def _keyset_params(self,orderby,values):
+        if len(set(name.startswith("-") for name in orderby)) == 1:
+            return list(values)
+        params = []
+        for i in range(len(values)):
+            params.extend(values[:i + 1])
+        return params
+
+    def compile_expression(self,expression,model=None,table=None,outer=None,joins=None):
+        #F 引用字段, OuterRef 引用外层查询的字段, 其它值作为参数绑定; 有 joins 时 F 可以是跨关联的路径
+        if isinstance(expression,OuterRef):
+            if outer is None:
+                raise CompileError("OuterRef(%s) can only be used in a subquery" % expression.name)
+            if model is not None and outer.table == model._opts.model_name:
+                raise CompileError("OuterRef cannot reference the same table '%s'" % outer.table)
+            field = outer.model._opts.get_field(expression.name) or outer.model._opts.get_column_field(expression.name)
+            column = field.get_column() if field is not None else expression.name
+            return self.quote_column(column,outer.table),[]
+        elif isinstance(expression,F) and joins is not None:
+            return self.resolve_field(expression.name,joins),[]
+        elif isinstance(expression,F):
+            column = expression.name
+            field = model._opts.get_field(column) if model is not None else None
+            if field is not None:
+                column = field.get_column()
+            return self.quote_column(column,table),[]
+        elif isinstance(expression,Aggregate):
+            _sql,_params = self.compile_expression(expression.expression,model,table,outer,joins)
+            return "%s(%s%s)" % (expression.function,"DISTINCT " if expression.distinct else "",_sql),_params
+        elif isinstance(expression,CombinedExpression):
+            lhs_sql,lhs_params = self.compile_expression(expression.lhs,model,table,outer,joins)
+            rhs_sql,rhs_params = self.compile_expression(expression.rhs,model,table,outer,joins)
+            return "(%s %s %s)" % (lhs_sql,expression.operator,rhs_sql),lhs_params + rhs_params
+        elif isinstance(expression,Value):
+            return self.placeholder,[expression.value]
+        raise CompileError("Objects that cannot be compiled:%s" % expression)
+
     def quote(self,name):
         return '`%s`' % name
 
+    def quote_column(self,column,table=None):
+        if table:
+            return '`%s`.`%s`' % (table,column)
+        return '`%s`' % column
+
     def alias_column(self,o,l):
         return '%s AS %s' % (o,l)
 
@@ -0,0 +1,225 @@
+import functools
+import threading
+from ormlite.base import configuration
+from ormlite.db.pool import ConnectionPool
+from ormlite.session import get_session
+
+
+class Atomic(object):
+    """
+    事务块, 可以作为上下文管理器或装饰器使用
+    最外层的块开始事务并在退出时提交或回滚, 嵌套的块使用 SAVEPOINT
+    块内执行的语句不再单独提交
+    """
+
+    def __init__(self,db):
+        self.db = db
+
+    def __enter__(self):
+        db = self.db
+        local = db._local
+        connection = db.acquire()
+        try:
+            if not local.atomic:
+                db.begin(connection)
+                local.atomic.append(None)
+                #事务中写入的 model, 结束时使查询结果缓存失效
+                local.dirty_models = set()
+            else:
+                name = "ormlite_sp_%s" % len(local.atomic)
+                db.savepoint(connection,name)
+                local.atomic.append(name)
+        except Exception:
+            db.release()
+            raise
+        return connection
+
+    def __exit__(self, exc_type, exc_instance, traceback):
+        db = self.db
+        local = db._local
+        connection = local.connection
+        name = local.atomic.pop()
+        try:
+            if name is None:
+                if exc_instance is None:
+                    connection.commit()
+                else:
+                    connection.rollback()
+            elif exc_instance is None:
+                db.savepoint_release(connection,name)
+            else:
+                db.savepoint_rollback(connection,name)
+        except Exception:
+            if name is None:
+                local.broken = True
+            raise
+        finally:
+            db.release()
+            if name is None:
+                #事务结束后 identity map 中的对象可能已经过期
+                session = get_session()
+                if session is not None:
+                    session.clear()
+                cache = configuration.cache
+                if cache is not None:
+                    for model in local.dirty_models:
+                        cache.invalidate(model)
+                local.dirty_models = set()
+
+    def __call__(self,func):
+        @functools.wraps(func)
+        def inner(*args,**kwargs):
+            with self.__class__(self.db):
+                return func(*args,**kwargs)
+        return inner
+
+
+class StreamConnection(object):
+    """
+    Query.iterator 使用的连接
+    非缓冲游标读完之前, 同一个连接不能执行其它语句(prefetch_related, 延迟字段, 外键访问等)
+    stream_dedicated 的数据库从连接池取一个单独的连接; 事务中只能使用事务的连接, 这时使用缓冲游标
+    """
+
+    def __init__(self,db):
+        self.db = db
+        self.connection = None
+        self.dedicated = db.stream_dedicated and not db.in_atomic()
+
+    def __enter__(self):
+        if self.dedicated:
+            self.connection = self.db.pool.acquire()
+        else:
+            self.connection = self.db.__enter__()
+        return self
+
+    def cursor(self):
+        #事务中不能使用单独的连接时, 改用缓冲游标
+        return self.db.get_cursor(self.connection,stream=self.dedicated or not self.db.stream_dedicated)
+
+    def __exit__(self, exc_type, exc_instance, traceback):
+        if not self.dedicated:
+            return self.db.__exit__(exc_type,exc_instance,traceback)
+        broken = False
+        try:
+            #只读取数据, 结束读取的事务
+            self.connection.rollback()
+        except Exception:
+            #没有读完就关闭时连接中可能还有未读取的结果
+            broken = True
+        finally:
+            self.db.pool.release(self.connection,discard=broken)
+
+
+class BaseDatabase(object):
+
+    name = None
+    column_types = {}
+    operators = {}
+    placeholder = None
+    max_params = None
+    #非缓冲的流式游标读完之前是否占用连接
+    stream_dedicated = False
+
+    pool_defaults = {
+        "MIN_SIZE": 0,
+        "MAX_SIZE": 10,
+        "TIMEOUT": 30,
+        "RECYCLE": None,
+        "PRE_PING": True,
+    }
+
+    def __init__(self,config):
+        self.config = config
+        self._local = threading.local()
+        self.pool = ConnectionPool(self.get_connector,is_usable=self.is_usable,**self.get_pool_params())
+
+    def get_pool_params(self):
+        #conf_db 配置中的 "POOL"
+        options = dict(self.pool_defaults)
+        options.update(self.config.get("POOL",{}))
+        return {
+            "min_size": options["MIN_SIZE"],
+            "max_size": options["MAX_SIZE"],
+            "timeout": options["TIMEOUT"],
+            "recycle": options["RECYCLE"],
+            "pre_ping": options["PRE_PING"],
+        }
+
+    def get_connection_params(self):
+        raise NotImplementedError
+
+    def get_connector(self):
+        params = self.get_connection_params()
+        return self.engine.connect(**params)
+
+    def is_usable(self,connection):
+        raise NotImplementedError
+
+    def begin(self,connection):
+        raise NotImplementedError
+
+    def savepoint(self,connection,name):
+        connection.cursor().execute("SAVEPOINT `%s`" % name)
+
+    def savepoint_release(self,connection,name):
+        connection.cursor().execute("RELEASE SAVEPOINT `%s`" % name)
+
+    def savepoint_rollback(self,connection,name):
+        cursor = connection.cursor()
+        cursor.execute("ROLLBACK TO SAVEPOINT `%s`" % name)
+        cursor.execute("RELEASE SAVEPOINT `%s`" % name)
+
+    def atomic(self):
+        return Atomic(self)
+
+    def stream(self):
+        return StreamConnection(self)
+
+    def in_atomic(self):
+        return bool(getattr(self._local,"atomic",None))
+
+    @property
+    def connector(self):
+        #当前线程正在使用的连接
+        return getattr(self._local,"connection",None)
+
+    def acquire(self):
+        #同一线程内嵌套使用时共用一个连接, 最外层释放时归还给连接池
+        local = self._local
+        depth = getattr(local,"depth",0)
+        if depth == 0:
+            local.connection = self.pool.acquire()
+            local.broken = False
+            local.atomic = []
+        local.depth = depth + 1
+        return local.connection
+
+    def release(self):
+        local = self._local
+        local.depth -= 1
+        if local.depth == 0:
+            connection = local.connection
+            local.connection = None
+            self.pool.release(connection,discard=local.broken)
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_instance, traceback):
+        local = self._local
+        try:
+            #在事务块中由事务块负责提交或回滚
+            if not local.atomic:
+                if not exc_instance:
+                    local.connection.commit()
+                else:
+                    local.connection.rollback()
+        except Exception:
+            local.broken = True
+            raise
+        finally:
+            self.release()
+
+    def close(self):
+        self.pool.close()
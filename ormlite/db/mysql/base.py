@@ -6,11 +6,14 @@ except ModuleNotFoundError:
     raise ModuleNotFoundError("No module named 'mysql',you may need to install 'mysql-connector' or 'mysql-connector-python'")
 
 from ormlite.exception import InvalidConfiguration
+from ormlite.db.base import BaseDatabase
 
 
-class Database(object):
+class Database(BaseDatabase):
 
     name = 'mysql'
+    #非缓冲游标读完之前连接不能执行其它语句
+    stream_dedicated = True
 
     column_types = {
         'BinaryField': 'BLOB',
@@ -45,12 +48,13 @@ class Database(object):
         'endswith': "LIKE %%%s"
     }
     placeholder = "%s"
+    #单条语句可绑定的最大参数数量
+    max_params = 65535
 
 
     def __init__(self,config):
-        self.config = config
-        self.connector = None
         self.engine = mysql.connector
+        super(Database,self).__init__(config)
 
     def get_connection_params(self):
         if not self.config['NAME']:
@@ -66,22 +70,33 @@ class Database(object):
             kwargs.update(self.config['OPTIONS'])
         return kwargs
 
-    def get_connector(self):
-        params = self.get_connection_params()
-        return self.engine.connect(**params)
+    def is_usable(self,connection):
+        try:
+            connection.ping(reconnect=False)
+        except mysql.connector.Error:
+            return False
+        return True
 
-    def __enter__(self):
-        if self.connector is None:
-            self.connector = self.get_connector()
-        return self.connector
+    def get_cursor(self,connection,stream=False):
+        #stream=True 时使用非缓冲游标, 结果集留在服务端按需读取
+        if stream:
+            return connection.cursor(buffered=False)
+        return connection.cursor()
 
-    def __exit__(self, exc_type, exc_instance, traceback):
-        if not exc_instance:
-            self.connector.commit()
-        else:
-            self.connector.rollback()
+    def begin(self,connection):
+        if not connection.in_transaction:
+            connection.start_transaction()
 
-    def close(self):
-        self.connector.close()
-        self.connector = None
+    def get_upsert_sql(self,conflict_columns,update_columns,pk_column):
+        #mysql 根据所有唯一键判断冲突, 不能指定冲突的列
+        if not update_columns:
+            return "ON DUPLICATE KEY UPDATE %s = %s" % (pk_column,pk_column)
+        sets = ",".join("%s = VALUES(%s)" % (column,column) for column in update_columns)
+        return "ON DUPLICATE KEY UPDATE %s" % sets
 
+    def get_bulk_insert_ids(self,cursor,count):
+        #多行插入后 lastrowid 是第一行的自增id
+        first_id = cursor.lastrowid
+        if not first_id:
+            return None
+        return list(range(first_id,first_id + count))
@@ -1,4 +1,5 @@
 from ormlite.fields import FieldException
+from ormlite.exception import ModelException
 from .base import Database
 
 
@@ -55,6 +56,8 @@ class Table():
         if primary_key:
             pks = (self.quote(f.get_column()) for f in primary_key)
             table.append("PRIMARY KEY(%s)" % ",".join(pks))
+        for index in self.get_indexes_declared():
+            table.append(self.as_sql_index(index))
         if foreign_key:
             for field in foreign_key:
                 constraint = self.get_constraint(field)
@@ -62,6 +65,16 @@ class Table():
         sql = "CREATE TABLE IF NOT EXISTS `%s` (\r\n\t%s\r\n);" % (table_name,",\r\n\t".join(table))
         return sql
 
+    def get_indexes_declared(self):
+        #InnoDB 会为外键自动创建索引
+        return [index for index in self.model._opts.indexes if not index.auto]
+
+    def as_sql_index(self,index):
+        if index.where:
+            raise ModelException("MySQL does not support partial index:%s" % index.get_name())
+        columns = ",".join(self.quote(column) for column in index.get_columns())
+        return "%sKEY %s (%s)" % ("UNIQUE " if index.unique else "",self.quote(index.get_name()),columns)
+
     def as_sql_delete(self):
         sql = "DROP TABLE `%s`;" % self.model._opts.model_name
         return sql
@@ -85,6 +98,34 @@ class Table():
             return True
         return False
 
+    def get_indexes(self,connection,partial=True):
+        #数据库中已有的索引: {索引名: (列名,...)}, partial=False 时不包括只索引列前缀的索引
+        cursor = connection.cursor()
+        cursor.execute("SHOW INDEX FROM %s" % self.quote(self.model._opts.model_name))
+        names = [col[0] for col in cursor.description]
+        rows = [dict(zip(names,row)) for row in cursor.fetchall()]
+        cursor.close()
+        indexes = {}
+        prefixed = set()
+        for row in sorted(rows,key=lambda r: (r["Key_name"],r["Seq_in_index"])):
+            indexes.setdefault(row["Key_name"],[]).append(row["Column_name"])
+            if row.get("Sub_part") is not None:
+                prefixed.add(row["Key_name"])
+        return dict((name,tuple(columns)) for name,columns in indexes.items() if partial or name not in prefixed)
+
+    def get_missing_indexes(self,connection):
+        #声明了但数据库中没有的索引, 同名的索引或前几列和声明的列相同的完整索引认为已存在
+        names = self.get_indexes(connection)
+        existing = list(self.get_indexes(connection,partial=False).values())
+        missing = []
+        for index in self.model._opts.indexes:
+            if index.get_name() in names:
+                continue
+            columns = index.get_columns()
+            if not any(cols[:len(columns)] == columns for cols in existing):
+                missing.append(index)
+        return missing
+
     def quote(self,name):
         return "`%s`" % name
 
@@ -0,0 +1,162 @@
+import time
+import threading
+from ormlite.exception import PoolTimeout
+
+
+class ConnectionPool(object):
+    """
+    线程安全的连接池
+    :param connect: 创建新连接的函数
+    :param min_size: 池中保持的最少连接数
+    :param max_size: 最多可以创建的连接数
+    :param timeout: 获取连接时等待的最长秒数, None 表示一直等待
+    :param recycle: 连接创建超过多少秒后被回收, None 表示不回收
+    :param pre_ping: 取出空闲连接时是否先检查连接是否可用
+    :param is_usable: 检查连接是否可用的函数
+    """
+
+    def __init__(self,connect,min_size=0,max_size=10,timeout=30,recycle=None,pre_ping=True,is_usable=None):
+        if max_size < 1:
+            raise ValueError("Pool 'max_size' must be greater than 0")
+        if min_size > max_size:
+            raise ValueError("Pool 'min_size' cannot be greater than 'max_size'")
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.is_usable = is_usable
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []
+        self._created = {}
+        self._size = 0
+        self._affinity = threading.local()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "timeouts": 0,
+            "created": 0,
+            "closed": 0,
+            "recycled": 0,
+            "failed_pings": 0,
+        }
+        for _ in range(min_size):
+            self._size += 1
+            connection = self._create()
+            with self._cond:
+                self._idle.append(connection)
+
+    def _create(self):
+        #调用前必须已经为新连接预留了位置(_size)
+        try:
+            connection = self.connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created[connection] = time.monotonic()
+            self._stats["created"] += 1
+        return connection
+
+    def _take_idle(self):
+        #优先取回当前线程上次使用的连接
+        last = getattr(self._affinity,"connection",None)
+        if last is not None:
+            for i,connection in enumerate(self._idle):
+                if connection is last:
+                    return self._idle.pop(i)
+        return self._idle.pop()
+
+    def _check(self,connection):
+        if self.recycle is not None:
+            created = self._created.get(connection,0)
+            if time.monotonic() - created > self.recycle:
+                with self._cond:
+                    self._stats["recycled"] += 1
+                return False
+        if self.pre_ping and self.is_usable is not None:
+            if not self.is_usable(connection):
+                with self._cond:
+                    self._stats["failed_pings"] += 1
+                return False
+        return True
+
+    def acquire(self):
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        waited = None
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    if waited is None:
+                        waited = time.monotonic()
+                        self._stats["waits"] += 1
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        self._stats["wait_time"] += time.monotonic() - waited
+                        raise PoolTimeout("No connection available within %s seconds (max_size=%s)" %
+                                          (self.timeout,self.max_size))
+                    self._cond.wait(remaining)
+                if waited is not None:
+                    self._stats["wait_time"] += time.monotonic() - waited
+                    waited = None
+                if self._idle:
+                    connection = self._take_idle()
+                else:
+                    connection = None
+                    self._size += 1
+            if connection is None:
+                connection = self._create()
+            elif not self._check(connection):
+                self._discard(connection)
+                continue
+            with self._cond:
+                self._stats["checkouts"] += 1
+            self._affinity.connection = connection
+            return connection
+
+    def release(self,connection,discard=False):
+        if discard:
+            self._discard(connection)
+            return
+        with self._cond:
+            self._idle.append(connection)
+            self._cond.notify()
+
+    def _discard(self,connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._created.pop(connection,None)
+            self._size -= 1
+            self._stats["closed"] += 1
+            self._cond.notify()
+
+    def close(self):
+        #关闭所有空闲连接, 已被取出的连接在归还后仍可使用
+        with self._cond:
+            idle = self._idle
+            self._idle = []
+        for connection in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            })
+        return stats
+
+    def __repr__(self):
+        return "<ConnectionPool size:%s max_size:%s>" % (self._size,self.max_size)
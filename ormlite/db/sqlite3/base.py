@@ -1,6 +1,7 @@
 import datetime
 import sqlite3 as engine
 from ormlite.exception import InvalidConfiguration
+from ormlite.db.base import BaseDatabase
 
 
 def parse_bool(value):
@@ -25,7 +26,7 @@ engine.register_adapter(engine.Time,time_adapter)
 
 
 
-class Database(object):
+class Database(BaseDatabase):
 
     name = 'sqlite3'
 
@@ -62,12 +63,26 @@ class Database(object):
         'endswith': "LIKE %%%s"
     }
     placeholder = "?"
+    #单条语句可绑定的最大参数数量(SQLITE_MAX_VARIABLE_NUMBER)
+    max_params = 999
+    #本地文件数据库的连接不会被服务端断开, 默认不做连接检查
+    pool_defaults = dict(BaseDatabase.pool_defaults,PRE_PING=False)
 
 
     def __init__(self,config):
-        self.config = config
-        self.connector = None
         self.engine = engine
+        super(Database,self).__init__(config)
+
+    def is_memory(self):
+        name = self.config.get('NAME')
+        return name == ':memory:' or (isinstance(name,str) and name.startswith('file::memory:'))
+
+    def get_pool_params(self):
+        params = super(Database,self).get_pool_params()
+        if self.is_memory():
+            #内存数据库每个连接都是一个独立的数据库, 只能使用一个常驻连接
+            params.update({"min_size": 1, "max_size": 1, "recycle": None})
+        return params
 
     def get_connection_params(self):
         if not self.config['NAME']:
@@ -78,28 +93,38 @@ class Database(object):
         }
         if "OPTIONS" in self.config:
             kwargs.update(self.config['OPTIONS'])
+        #连接池保证同一时间只有一个线程使用某个连接, 但连接可以在线程之间传递
         kwargs.update({'check_same_thread': False})
         return kwargs
 
-    def get_connector(self):
-        params = self.get_connection_params()
-        return self.engine.connect(**params)
-
-    def __enter__(self):
-        if self.connector is None:
-            self.connector = self.get_connector()
-        return self.connector
-
-    def __exit__(self, exc_type, exc_instance, traceback):
-        if not exc_instance:
-            self.connector.commit()
-        else:
-            self.connector.rollback()
-
-    def close(self):
-        self.connector.close()
-        self.connector = None
-
-#SQL标准规定字符串必须使用“单引号”,引用时标识符(如表名和列名)必须使用“双引号”
-#sqlte3 使用的是双引号，同时sqlite3兼用mysql的 “反引号”
-#所以这里统一使用反引号
+    def is_usable(self,connection):
+        try:
+            connection.execute("SELECT 1")
+        except engine.Error:
+            return False
+        return True
+
+    def get_cursor(self,connection,stream=False):
+        #sqlite3 的游标本身就是逐行读取的
+        return connection.cursor()
+
+    def begin(self,connection):
+        if not connection.in_transaction:
+            connection.execute("BEGIN")
+
+    def get_upsert_sql(self,conflict_columns,update_columns,pk_column):
+        #INSERT ... ON CONFLICT, 需要 sqlite 3.24 以上
+        target = "(%s)" % ",".join(conflict_columns) if conflict_columns else ""
+        if not update_columns:
+            return "ON CONFLICT%s DO NOTHING" % target
+        if not conflict_columns:
+            target = "(%s)" % pk_column
+        sets = ",".join("%s = excluded.%s" % (column,column) for column in update_columns)
+        return "ON CONFLICT%s DO UPDATE SET %s" % (target,sets)
+
+    def get_bulk_insert_ids(self,cursor,count):
+        #多行插入后 lastrowid 是最后一行的rowid
+        last_id = cursor.lastrowid
+        if not last_id:
+            return None
+        return list(range(last_id - count + 1,last_id + 1))
@@ -61,6 +61,17 @@ class Table():
         sql = 'CREATE TABLE IF NOT EXISTS "%s" (\r\n\t%s\r\n);' % (table_name,",\r\n\t".join(table))
         return sql
 
+    def as_sql_index(self,index):
+        columns = ",".join('"%s"' % column for column in index.get_columns())
+        sql = 'CREATE %sINDEX IF NOT EXISTS "%s" ON "%s" (%s)' % ("UNIQUE " if index.unique else "",
+                    index.get_name(),self.model._opts.model_name,columns)
+        if index.where:
+            sql += " WHERE %s" % index.where
+        return sql + ";"
+
+    def as_sql_indexes(self):
+        return [self.as_sql_index(index) for index in self.model._opts.indexes]
+
     def as_sql_delete(self):
         sql = "DROP TABLE %s;" % self.model._opts.model_name
         return sql
@@ -71,6 +82,8 @@ class Table():
         sql = self.as_sql_create()
         print(sql)
         connection.execute(sql)
+        for sql in self.as_sql_indexes():
+            connection.execute(sql)
         connection.commit()
 
     def is_existed(self,connection):
@@ -81,4 +94,29 @@ class Table():
             return True
         return False
 
+    def get_indexes(self,connection,partial=True):
+        #数据库中已有的索引: {索引名: (列名,...)}, partial=False 时不包括部分索引
+        table = self.model._opts.model_name
+        indexes = {}
+        for row in connection.execute('PRAGMA index_list("%s")' % table).fetchall():
+            if not partial and row[4]:
+                continue
+            name = row[1]
+            info = connection.execute('PRAGMA index_info("%s")' % name).fetchall()
+            indexes[name] = tuple(col[2] for col in sorted(info))
+        return indexes
 
+    def get_missing_indexes(self,connection):
+        #声明了但数据库中没有的索引, 同名的索引或前几列和声明的列相同的非部分索引认为已存在
+        names = self.get_indexes(connection)
+        existing = list(self.get_indexes(connection,partial=False).values())
+        pk_columns = tuple(f.get_column() for f in self.model._opts.fields if f.primary_key)
+        existing.append(pk_columns)
+        missing = []
+        for index in self.model._opts.indexes:
+            if index.get_name() in names:
+                continue
+            columns = index.get_columns()
+            if not any(cols[:len(columns)] == columns for cols in existing):
+                missing.append(index)
+        return missing
@@ -3,8 +3,18 @@ from ormlite.base import configuration
 
 def create_tables(models,db):
     Table = configuration.db_engine.table.Table
-    connection = db.get_connector()
-    for model in models:
-        Table(model).create(connection)
-    connection.commit()
-    connection.close()
+    with db as connection:
+        for model in models:
+            Table(model).create(connection)
+
+
+def get_missing_indexes(models,db):
+    #返回声明了但数据库中没有的索引: {model: [Index,...]}
+    Table = configuration.db_engine.table.Table
+    missing = {}
+    with db as connection:
+        for model in models:
+            indexes = Table(model).get_missing_indexes(connection)
+            if indexes:
+                missing[model] = indexes
+    return missing
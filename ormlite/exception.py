@@ -36,3 +36,6 @@ class InvalidConfiguration(ORMLiteException):
 
 class ModelAgentError(ORMLiteException):
     pass
+
+class PoolTimeout(ORMLiteException):
+    pass
@@ -0,0 +1,132 @@
+class Expression(object):
+    #可以在数据库中计算的表达式, 支持 + - * / 运算
+
+    def _combine(self,other,operator,reverse=False):
+        if not isinstance(other,Expression):
+            other = Value(other)
+        if reverse:
+            return CombinedExpression(other,operator,self)
+        return CombinedExpression(self,operator,other)
+
+    def __add__(self,other):
+        return self._combine(other,"+")
+
+    def __radd__(self,other):
+        return self._combine(other,"+",True)
+
+    def __sub__(self,other):
+        return self._combine(other,"-")
+
+    def __rsub__(self,other):
+        return self._combine(other,"-",True)
+
+    def __mul__(self,other):
+        return self._combine(other,"*")
+
+    def __rmul__(self,other):
+        return self._combine(other,"*",True)
+
+    def __truediv__(self,other):
+        return self._combine(other,"/")
+
+    def __rtruediv__(self,other):
+        return self._combine(other,"/",True)
+
+
+class F(Expression):
+    """
+    引用字段的值, 在数据库中计算
+        Goods.object.query(id=5).update(stock=F('stock') - 1)
+        Goods.object.query(price__gt=F('cost'))
+    """
+
+    def __init__(self,name):
+        self.name = name
+
+    def __repr__(self):
+        return "F(%s)" % self.name
+
+
+class Value(Expression):
+    #作为参数绑定的值
+
+    def __init__(self,value):
+        self.value = value
+
+    def __repr__(self):
+        return "Value(%r)" % (self.value,)
+
+
+class CombinedExpression(Expression):
+
+    def __init__(self,lhs,operator,rhs):
+        self.lhs = lhs
+        self.operator = operator
+        self.rhs = rhs
+
+    def __repr__(self):
+        return "(%r %s %r)" % (self.lhs,self.operator,self.rhs)
+
+
+class OuterRef(F):
+    """
+    在子查询中引用外层查询的字段
+        User.object.query(Exists(Order.object.query(user=OuterRef('id'),total__gt=100)))
+    """
+
+    def __repr__(self):
+        return "OuterRef(%s)" % self.name
+
+
+class Exists(object):
+    """
+    EXISTS (子查询) 条件, 作为 query()/exclude() 的位置参数, ~Where(Exists(...)) 为 NOT EXISTS
+    """
+
+    def __init__(self,query):
+        self.query = query
+
+    def __repr__(self):
+        return "Exists(%r)" % (self.query,)
+
+
+class Aggregate(Expression):
+    """
+    聚合函数, 参数为字段名或表达式, 字段名可以跨外键和反向关联(例如 'order_set__total')
+        Order.object.all().aggregate(total=Sum('total'))
+        User.object.all().annotate(orders=Count('order_set'))
+    """
+    function = None
+
+    def __init__(self,expression,distinct=False):
+        if not isinstance(expression,Expression):
+            expression = F(expression)
+        self.expression = expression
+        self.distinct = distinct
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__,self.expression)
+
+
+class Min(Aggregate):
+    function = "MIN"
+
+
+class Max(Aggregate):
+    function = "MAX"
+
+
+class Sum(Aggregate):
+    function = "SUM"
+
+
+class Avg(Aggregate):
+    function = "AVG"
+
+
+class Count(Aggregate):
+    #Count() 为 COUNT(*)
+    function = "COUNT"
+
+    def __init__(self,expression="*",distinct=False):
+        super(Count,self).__init__(expression,distinct)
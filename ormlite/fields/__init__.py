@@ -1,9 +1,10 @@
 from ormlite.fields.base import *
 from ormlite.fields.related import *
+from ormlite.fields.index import Index
 
 
 __all__ = [
     "Field","BooleanField","CharField","DateField","DateTimeField","FloatField",
     "IntegerField","TimeFiled","TextField","PrimaryKey","FieldException","RelatedField",
-    "ForeignKey","RelatedDescriptor","CASCADE","SET_NULL","NOT_ACTION","RESTRICT"
+    "ForeignKey","RelatedDescriptor","Index","DeferredAttribute","ReverseRelatedDescriptor","CASCADE","SET_NULL","NOT_ACTION","RESTRICT"
 ]
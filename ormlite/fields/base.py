@@ -7,18 +7,20 @@ class Field(object):
 
     is_related = False
 
-    def __init__(self,default=None,null=True,unique=False,primary_key=False,column_name=None):
+    def __init__(self,default=None,null=True,unique=False,primary_key=False,column_name=None,db_index=False):
         """
         :param default: 默认值
         :param null: 值是否可为NULL
         :param unique: 是否唯一
         :param primary_key: 是否是主键
         :param column_name: 字段名
+        :param db_index: 是否为字段创建索引
         """
         self.default = default
         self.null = null
         self.unique = unique
         self.primary_key = primary_key
+        self.db_index = db_index
         self.column = column_name
         self.name = None
         self.model = None
@@ -31,6 +33,10 @@ class Field(object):
             return self.column
         return self.name
 
+    def get_attname(self):
+        #实例中保存字段值的属性名
+        return self.name
+
     def check(self):
         self._check_field_name()
         self._check_definition()
@@ -189,3 +195,25 @@ class PrimaryKey(IntegerField):
 
     def get_type(self):
         return "PrimaryKey"
+
+
+class DeferredAttribute(object):
+    """
+    model类上字段属性的描述符, 通过类访问时返回字段
+    实例的 __dict__ 中有值时不会调用(非数据描述符), 否则加载 only()/defer() 延迟的字段
+    """
+
+    def __init__(self,field):
+        self.field = field
+        self.attname = field.get_attname()
+
+    def __get__(self,instance,owner):
+        if instance is None:
+            return self.field
+        attributes = instance.__dict__
+        deferred = attributes.get("_deferred")
+        if deferred and self.attname in deferred:
+            instance._load_deferred()
+            if self.attname in attributes:
+                return attributes[self.attname]
+        raise AttributeError("%r object has no attribute %r" % (owner.__name__,self.attname))
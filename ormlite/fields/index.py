@@ -0,0 +1,46 @@
+class Index(object):
+    """
+    在model中声明索引
+        idx_user_time = ormlite.Index('user','created_time')
+    :param fields: 字段名, 按顺序组成索引
+    :param name: 索引名, 默认为 "idx_<表名>_<列名>", 部分索引默认为 "idx_<表名>_<列名>_partial"
+    :param unique: 是否唯一索引
+    :param where: 部分索引的条件(SQL, 只有sqlite3支持), 例如 '"total" > 0'
+    :param include: 覆盖索引额外包含的字段, 添加到索引列的末尾
+    """
+
+    def __init__(self,*fields,name=None,unique=False,where=None,include=None):
+        if not fields:
+            raise ValueError("Index requires at least one field")
+        self.fields = tuple(fields)
+        self.name = name
+        self.unique = unique
+        self.where = where
+        self.include = tuple(include or ())
+        self.auto = False
+        self.model = None
+
+    def get_fields(self):
+        opts = self.model._opts
+        fields = []
+        for name in self.fields + self.include:
+            field = opts.get_field(name)
+            if field is None:
+                raise ValueError("%s has no field '%s'" % (self.model.__name__,name))
+            fields.append(field)
+        return fields
+
+    def get_columns(self):
+        return tuple(field.get_column() for field in self.get_fields())
+
+    def get_name(self):
+        if self.name:
+            return self.name
+        name = "idx_%s_%s" % (self.model._opts.model_name,"_".join(self.get_columns()))
+        if self.where:
+            #和字段上的完整索引区分
+            name += "_partial"
+        return name
+
+    def __repr__(self):
+        return "<Index:%s>" % (",".join(self.fields + self.include),)
@@ -14,7 +14,9 @@ class RelatedField(Field):
     is_related = True
 
     def __init__(self,related_model,related_field,on_delete,*args,**kwargs):
+        related_name = kwargs.pop("related_name",None)
         super(RelatedField,self).__init__(*args,**kwargs)
+        self._related_name = related_name
         self._rel_field = related_field
         self._rel_model = related_model
         self.on_update = CASCADE
@@ -31,6 +33,20 @@ class RelatedField(Field):
     def get_column(self):
         return self.name + "_id"
 
+    def get_attname(self):
+        #实例中保存外键的值, 关联对象由 RelatedDescriptor 访问
+        return self.get_column()
+
+    def get_cache_name(self):
+        #RelatedDescriptor 缓存关联对象的属性名
+        return "_%s_cache" % self.name
+
+    def get_related_name(self):
+        #关联的model通过这个名字反向访问当前model的对象, 默认为 "<model名小写>_set"
+        if self._related_name:
+            return self._related_name
+        return "%s_set" % self.model._opts.model_name.lower()
+
     def get_related_model(self):
         if self.related_model is not None:
             return self.related_model
@@ -83,7 +99,7 @@ class RelatedDescriptor():
         self.from_field = field
         self._to_model = None
         self._to_field = None
-        self.cache_name = "_%s_cache" % field.name
+        self.cache_name = field.get_cache_name()
 
 
     @property
@@ -122,8 +138,9 @@ class RelatedDescriptor():
     def __set__(self,instance,value):
         if value is None:
             setattr(instance, self.cache_name, None)
+            setattr(instance, self.from_field.get_column(), None)
             return
-        if not isinstance(value,self.to_field):
+        if not isinstance(value,self.to_model):
             raise ValueError('"%s.%s" must be a "%s" instance:%s' % (self.from_model._opts.model_name,
                                 self.from_field.name,self.to_model._opts.model_name,value))
         setattr(instance,self.cache_name,value)
@@ -133,4 +150,24 @@ class RelatedDescriptor():
         return "<RelatedDescriptor:%s>" % (self.from_field.name,)
 
 
+class ReverseRelatedDescriptor():
+    #外键的反向访问, 例如 user.order_set 返回该用户的所有Order的Query
+
+    def __init__(self,field):
+        self.field = field
+        self.cache_name = "_%s_cache" % field.get_related_name()
+
+    def __get__(self,instance,owner):
+        if instance is None:
+            return self
+        query = instance.__dict__.get(self.cache_name,None)
+        if query is not None:
+            return query
+        value = getattr(instance,self.field.get_related_field().name)
+        return self.field.model.object.query(**{self.field.get_column():value})
 
+    def __set__(self,instance,value):
+        raise AttributeError("Reverse relation '%s' cannot be assigned" % self.field.get_related_name())
+
+    def __repr__(self):
+        return "<ReverseRelatedDescriptor:%s>" % (self.field.get_related_name(),)
@@ -0,0 +1,117 @@
+import time
+
+
+class QueryEvent(object):
+    """
+    一次SQL执行的信息, 传给 before/after 回调
+    sql, params:    编译后的SQL和参数
+    model:          执行语句的model
+    statement:      语句类型 SELECT/INSERT/UPDATE/DELETE...
+    rowcount:       读取或影响的行数
+    compile_time:   编译SQL的时间(秒)
+    acquire_time:   从连接池取得连接的时间(秒), 包括等待空闲连接的时间
+    execute_time:   cursor.execute 的时间(秒)
+    fetch_time:     读取结果并转换的时间(秒)
+    exception:      执行出错时的异常
+    """
+
+    def __init__(self,instrument,obj,placeholder):
+        self.instrument = instrument
+        self.model = getattr(obj,"model",None)
+        self.statement = getattr(obj,"statement",None)
+        self.placeholder = placeholder
+        self.sql = None
+        self.params = None
+        self.rowcount = None
+        self.compile_time = 0.0
+        self.acquire_time = 0.0
+        self.execute_time = 0.0
+        self.fetch_time = 0.0
+        self.exception = None
+        self._clock = time.perf_counter()
+
+    def compiled(self,sql,params):
+        now = time.perf_counter()
+        self.compile_time = now - self._clock
+        self.sql = sql
+        self.params = params
+        self.instrument.send_before(self)
+        self._clock = time.perf_counter()
+
+    def acquired(self):
+        now = time.perf_counter()
+        self.acquire_time = now - self._clock
+        self._clock = now
+
+    def executed(self):
+        now = time.perf_counter()
+        self.execute_time = now - self._clock
+        self._clock = now
+
+    def finish(self,rowcount=None,exception=None):
+        if exception is None:
+            self.fetch_time = time.perf_counter() - self._clock
+        self.rowcount = rowcount
+        self.exception = exception
+        self.instrument.send_after(self)
+
+    @property
+    def total_time(self):
+        return self.compile_time + self.acquire_time + self.execute_time + self.fetch_time
+
+    @property
+    def formatted_sql(self):
+        #把参数填入SQL, 只用于显示; 只有访问这个属性时才会格式化
+        if not self.params:
+            return self.sql
+        parts = self.sql.split(self.placeholder)
+        if len(parts) != len(self.params) + 1:
+            return "%s %r" % (self.sql,self.params)
+        sql = [parts[0]]
+        for value,part in zip(self.params,parts[1:]):
+            sql.append(repr(value))
+            sql.append(part)
+        return "".join(sql)
+
+    def __repr__(self):
+        return "<QueryEvent %s %s>" % (self.statement,self.sql)
+
+
+class Instrumentation(object):
+    """
+    查询回调, 所有执行SQL的地方都会调用
+        before(event): SQL编译后, 执行前
+        after(event):  执行结束(或出错)后, 包含行数和各阶段的时间
+    没有注册回调时不会创建 QueryEvent, 也不会计时
+    """
+
+    def __init__(self):
+        self.listeners = []
+
+    @property
+    def enabled(self):
+        return bool(self.listeners)
+
+    def connect(self,before=None,after=None):
+        if before is None and after is None:
+            raise ValueError("connect() requires 'before' or 'after' callback")
+        listener = (before,after)
+        self.listeners.append(listener)
+        return listener
+
+    def disconnect(self,listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def start(self,obj,placeholder):
+        return QueryEvent(self,obj,placeholder)
+
+    def send_before(self,event):
+        for before,_ in list(self.listeners):
+            if before is not None:
+                before(event)
+
+    def send_after(self,event):
+        for _,after in list(self.listeners):
+            if after is not None:
+                after(event)
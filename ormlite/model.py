@@ -1,10 +1,15 @@
 from ormlite import configuration
-from ormlite.fields import Field,PrimaryKey,RelatedDescriptor
-from ormlite.query import Query,Insert,Update,Delete,Where
-from ormlite.exception import ObjectNotExists,ModelException,MultiResult,ModelAgentError
+from ormlite.fields import Field,PrimaryKey,RelatedDescriptor,ReverseRelatedDescriptor,DeferredAttribute,Index
+from ormlite.query import Query,Insert,BulkInsert,BulkUpsert,Update,BulkUpdate,Delete,load_deferred,make_where
+from ormlite.exception import ObjectNotExists,ModelException,MultiResult
+from ormlite.aio import run_in_executor
+from ormlite.session import get_session
 
 PK_FIELD_NAME = "id"
 
+#关联的model还没有定义的外键, 等关联的model定义后再添加反向访问
+_pending_related = []
+
 class ModelAgent(object):
 
 
@@ -18,24 +23,142 @@ class ModelAgent(object):
         self._insert(object=obj)
         return obj
 
+    def bulk_create(self,objs,batch_size=None):
+        """
+        批量插入, 每个批次编译成一条多行 INSERT 语句, 所有批次在同一个事务中执行
+        :param objs: model实例列表
+        :param batch_size: 每个批次的最大行数, 会受数据库参数数量限制
+        """
+        objs = list(objs)
+        for obj in objs:
+            if not isinstance(obj,self.model):
+                raise TypeError("Argument 'objs' should be a list of %s" % self.model)
+        if not objs:
+            return objs
+        BulkInsert(model=self.model,instances=objs,batch_size=batch_size).execute()
+        for obj in objs:
+            #回填了主键的对象之后 save() 只更新修改过的字段
+            if obj.pk is not None:
+                obj._mark_saved()
+        session = get_session()
+        if session is not None:
+            for obj in objs:
+                session.add(obj)
+        return objs
+
+    def bulk_update(self,objs,fields,batch_size=None):
+        """
+        批量更新, 每个批次编译成一条 UPDATE ... SET 字段 = CASE 主键 WHEN ... END WHERE 主键 IN (...)
+        所有批次在同一个事务中执行, 返回更新的行数
+        :param objs: model实例列表, 主键不能为None
+        :param fields: 要更新的字段名
+        :param batch_size: 每个批次的最大对象数, 会受数据库参数数量限制
+        """
+        objs = list(objs)
+        fields = list(fields)
+        if not fields:
+            raise ValueError("bulk_update() requires 'fields'")
+        for name in fields:
+            field = self.model._opts.get_field(name)
+            if field is None:
+                raise ValueError("%s has no field '%s'" % (self.model.__name__,name))
+            if field.primary_key:
+                raise ValueError("bulk_update() cannot update primary key '%s'" % name)
+        for obj in objs:
+            if not isinstance(obj,self.model):
+                raise TypeError("Argument 'objs' should be a list of %s" % self.model)
+            if obj.pk is None:
+                raise AttributeError("%s primary key value is invalid:%s" % (obj,obj.pk))
+        if not objs:
+            return 0
+        rowcount = BulkUpdate(model=self.model,instances=objs,fields=fields,batch_size=batch_size).execute()
+        for obj in objs:
+            obj._mark_saved(fields)
+        return rowcount
+
+    def upsert(self,obj,conflict_fields=None,update_fields=None):
+        """
+        插入单个对象, 冲突时更新已有的行, 参数同 bulk_upsert
+        """
+        self.bulk_upsert([obj],conflict_fields,update_fields)
+        return obj
+
+    def bulk_upsert(self,objs,conflict_fields=None,update_fields=None,batch_size=None):
+        """
+        批量插入, 和已有的行冲突时更新, 每个批次编译成一条语句, 返回数据库报告的影响行数
+        更新已有的行时不会回填主键
+        :param objs: model实例列表
+        :param conflict_fields: 判断冲突的字段, 需要有唯一约束, 默认为主键(mysql 使用所有唯一键, 忽略该参数)
+        :param update_fields: 冲突时更新的字段, 默认为冲突字段以外的全部字段, 为空列表时不更新
+        :param batch_size: 每个批次的最大行数, 会受数据库参数数量限制
+        """
+        opts = self.model._opts
+        pk_name = opts.pk_field.name
+        objs = list(objs)
+        conflict_fields = list(conflict_fields) if conflict_fields else [pk_name]
+        if update_fields is None:
+            update_fields = [field.name for field in opts.fields
+                             if field.name not in conflict_fields and not field.primary_key]
+        for name in list(conflict_fields) + list(update_fields):
+            if opts.get_field(name) is None:
+                raise ValueError("%s has no field '%s'" % (self.model.__name__,name))
+        for obj in objs:
+            if not isinstance(obj,self.model):
+                raise TypeError("Argument 'objs' should be a list of %s" % self.model)
+        if not objs:
+            return 0
+        upsert = BulkUpsert(model=self.model,instances=objs,conflict_fields=conflict_fields,
+                            update_fields=update_fields,batch_size=batch_size)
+        upsert.execute()
+        session = get_session()
+        if session is not None:
+            #已有的行可能被更新
+            session.clear(self.model)
+        return upsert.rowcount
+
     def get_or_create(self,**kwargs):
+        #查询不到时插入, 和其它连接同时插入产生冲突时不报错, 重新查询已有的行(需要唯一约束)
         try:
            return self.get(**kwargs)
         except self.model.DoesNotExists:
-           return self.create(**kwargs)
+           pass
+        obj = self.model(**kwargs)
+        upsert = BulkUpsert(model=self.model,instances=[obj])
+        upsert.execute()
+        if upsert.rowcount:
+            return obj
+        return self.get(**kwargs)
 
     def get(self, **kwargs):
+        #开启 session 时按主键查询先查找 identity map
+        session = get_session()
+        if session is not None and len(kwargs) == 1:
+            pk_name = self.model.get_pk_name()
+            if pk_name in kwargs:
+                obj = session.get(self.model,kwargs[pk_name])
+                if obj is not None:
+                    return obj
         return Query(self.model,self.fields).get(**kwargs)
 
+    async def aget(self,**kwargs):
+        return await run_in_executor(self.get,**kwargs)
+
+    async def acreate(self,**kwargs):
+        return await run_in_executor(self.create,**kwargs)
+
+    async def abulk_create(self,objs,batch_size=None):
+        return await run_in_executor(self.bulk_create,objs,batch_size)
+
     def all(self):
         return Query(self.model, fields=self.fields)
 
-    def query(self, **kwargs):
-        where = Where(kwargs)
+    def query(self,*args,**kwargs):
+        #位置参数可以是 Where 或 Exists(子查询)
+        where = make_where(args,kwargs)
         return Query(self.model,fields=self.fields,where=where)
 
-    def exclude(self,**kwargs):
-        where = ~Where(kwargs)
+    def exclude(self,*args,**kwargs):
+        where = ~make_where(args,kwargs)
         return Query(self.model,fields=self.fields,where=where)
 
     def values(self,*fields,**kwargs):
@@ -44,11 +167,17 @@ class ModelAgent(object):
     def items(self,*fields,**kwargs):
         return Query(self.model,fields=self.fields).items(*fields,**kwargs)
 
+    def annotate(self,**aggregates):
+        return Query(self.model,fields=self.fields).annotate(**aggregates)
+
+    def aggregate(self,**aggregates):
+        return Query(self.model).aggregate(**aggregates)
+
     def count(self):
         return Query(self.model).count()
 
     def update(self, **kwargs):
-        return Update(model=self.model,update_fields=kwargs).execute()
+        return Query(self.model).update(**kwargs)
 
     def _insert(self,object):
         if not isinstance(object,self.model):
@@ -56,6 +185,10 @@ class ModelAgent(object):
         insert = Insert(model=self.model,instance=object)
         insert.execute()
         object.pk = insert.get_id()
+        object._mark_saved()
+        session = get_session()
+        if session is not None:
+            session.add(object)
 
     def _update_obj(self,object,fields=None):
         if not isinstance(object,self.model):
@@ -69,6 +202,9 @@ class ModelAgent(object):
             raise TypeError("Argument 'obj' should be %s type" % self.model)
         if obj.pk is None:
             raise AttributeError("%s primary key '%s' field value is invalid:%s" % (obj,obj.pk_name,obj.pk) )
+        session = get_session()
+        if session is not None:
+            session.discard(self.model,obj.pk)
         return Delete(model=self.model,instance=obj).execute()
 
 
@@ -91,7 +227,13 @@ class Options(object):
         self.fields = None
         self.pk_field = None
         self.related_fields = {}
-
+        self.reverse_related = {}
+        self.column_map = {}
+        self.indexes = []
+        #从数据库行创建实例的函数, 按列的结构缓存
+        self.hydrators = {}
+        #查询结果缓存的秒数, None 时不缓存
+        self.cache_ttl = None
 
     def get_field(self,field_name):
         return self.field_map.get(field_name,None)
@@ -99,6 +241,9 @@ class Options(object):
     def get_fields_name(self):
         return tuple(self.field_map.keys())
 
+    def get_column_field(self,column):
+        return self.column_map.get(column,None)
+
     def get_columns(self):
         return tuple(field.get_column() for field in self.fields)
 
@@ -113,9 +258,12 @@ class ModelMetaclass(type):
         model = super(ModelMetaclass, cls).__new__(cls, cls_name, bases, attrs)
         #收集Field
         field_mappings = {}
+        indexes = []
         for attr_name,attr in attrs.items():
             if isinstance(attr,Field):
                 field_mappings[attr_name] = attr
+            elif isinstance(attr,Index):
+                indexes.append(attr)
         # 处理主键和关系字段
         pk_fields = []
         rel_fields = []
@@ -141,7 +289,12 @@ class ModelMetaclass(type):
         opts.model_name = cls_name
         opts.field_map = field_mappings
         opts.fields = tuple(field_mappings.values())
+        opts.column_map = dict((field.get_column(),field) for field in opts.fields)
+        for field in opts.fields:
+            setattr(model,field.get_attname(),DeferredAttribute(field))
+        opts.cache_ttl = getattr(model,"cache_ttl",None)
         model._opts = opts
+        opts.indexes = cls.collect_indexes(model,indexes)
         model.object = ModelAgentDescriptor(model)
         cls.object_bind_property(model,'DoesNotExists',
                                  tuple(base.DoesNotExists for base in bases if hasattr(base,"DoesNotExists"))
@@ -150,8 +303,50 @@ class ModelMetaclass(type):
                                  tuple(base.MultiResult for base in bases if hasattr(base, "MultiResult"))
                                  or (MultiResult,))
         configuration.register_model(model)
+        cls.contribute_related(model)
         return model
 
+    @staticmethod
+    def contribute_related(model):
+        global _pending_related
+        pending = []
+        for field in _pending_related + list(model._opts.related_fields):
+            rel_model = field.get_related_model()
+            if rel_model is None:
+                pending.append(field)
+                continue
+            name = field.get_related_name()
+            existing = rel_model._opts.reverse_related.get(name)
+            if existing is not None:
+                #重新定义同一个 model 时替换原来的外键
+                if (existing.model._opts.model_name,existing.name) != (field.model._opts.model_name,field.name):
+                    raise ModelException("Reverse name '%s' of %s.%s clashes with %s.%s, pass 'related_name' to one of them"
+                                         % (name,field.model.__name__,field.name,existing.model.__name__,existing.name))
+            elif hasattr(rel_model,name):
+                raise ModelException("Reverse name '%s' of %s.%s clashes with attribute %s.%s, pass 'related_name'"
+                                     % (name,field.model.__name__,field.name,rel_model.__name__,name))
+            rel_model._opts.reverse_related[name] = field
+            setattr(rel_model,name,ReverseRelatedDescriptor(field))
+        _pending_related = pending
+
+    @staticmethod
+    def collect_indexes(model,indexes):
+        #声明的索引, db_index=True 的字段, 以及没有索引的外键
+        indexes = list(indexes)
+        for field in model._opts.fields:
+            if field.primary_key or field.unique:
+                continue
+            if field.db_index or field.is_related:
+                #部分索引只包含满足条件的行, 不能代替字段上的索引
+                if any(index.fields[0] == field.name and not index.where for index in indexes):
+                    continue
+                index = Index(field.name)
+                index.auto = field.is_related and not field.db_index
+                indexes.append(index)
+        for index in indexes:
+            index.model = model
+        return indexes
+
     @staticmethod
     def check_fields(fields):
         for field in fields:
@@ -207,14 +402,95 @@ class Model(object,metaclass=ModelMetaclass):
         if fields:
             self.__class__.object._update_obj(object=self,fields=fields)
         elif self.pk:
-            self.__class__.object._update_obj(object=self)
+            fields = self.get_dirty_fields()
+            if fields is None:
+                self.__class__.object._update_obj(object=self)
+            elif fields:
+                fields.extend(self._get_auto_update_fields(fields))
+                self.__class__.object._update_obj(object=self,fields=fields)
+            else:
+                #没有字段被修改, 不需要访问数据库
+                return
         else:
             self.__class__.object._insert(self)
+        self._mark_saved(fields)
+
+    async def asave(self,fields=None):
+        return await run_in_executor(self.save,fields)
+
+    async def adelete(self):
+        return await run_in_executor(self.delete)
 
     def delete(self):
         if self.pk is not None:
             self.__class__.object._delete_obj(self)
             self.pk = None
+            self.__dict__.pop("_snapshot",None)
+
+    def _get_field_value(self,field):
+        return getattr(self,field.get_attname(),None)
+
+    def _load_deferred(self):
+        #加载 only()/defer() 延迟的字段, 同一个结果集中的对象一起加载
+        loader = self.__dict__.get("_deferred_loader")
+        if loader is not None:
+            loader.load()
+        if self.__dict__.get("_deferred"):
+            load_deferred(self.__class__,[self])
+
+    def get_dirty_fields(self):
+        """
+        返回加载后被修改过的字段名列表
+        对象不是从数据库加载(没有快照)时返回None
+        """
+        snapshot = self.__dict__.get("_snapshot")
+        if snapshot is None:
+            return None
+        loaded = dict(zip(*snapshot))
+        dirty = []
+        for field in self._opts.fields:
+            column = field.get_column()
+            if field.primary_key:
+                continue
+            if column not in loaded:
+                #延迟加载的字段在加载前被赋值
+                if field.get_attname() in self.__dict__:
+                    dirty.append(field.name)
+                continue
+            if self._get_field_value(field) != loaded[column]:
+                dirty.append(field.name)
+        return dirty
+
+    def _get_auto_update_fields(self,fields):
+        #有字段更新时, 同时更新需要自动设置时间的字段
+        auto_fields = []
+        for field in self._opts.fields:
+            if field.name in fields or field.is_related:
+                continue
+            #只读 __dict__, 不加载 only()/defer() 延迟的字段
+            if self.__dict__.get(field.get_attname()) is None:
+                value = getattr(field,"value_on_update",None)
+                if value is not None:
+                    setattr(self,field.name,value)
+                    auto_fields.append(field.name)
+        return auto_fields
+
+    def _mark_saved(self,fields=None):
+        #保存后更新快照, 只保存了部分字段时其余字段保持原来的状态
+        snapshot = self.__dict__.get("_snapshot")
+        if fields and snapshot is not None:
+            loaded = dict(zip(*snapshot))
+        elif fields:
+            #没有快照时只有主键和写入的字段和数据库一致, 其余字段之后 save() 仍然是修改过的
+            pk_field = self._opts.pk_field
+            loaded = {pk_field.get_column():self._get_field_value(pk_field)}
+        else:
+            loaded = {}
+            fields = [field.name for field in self._opts.fields]
+        for name in fields:
+            field = self._opts.get_field(name)
+            loaded[field.get_column()] = self._get_field_value(field)
+        self._snapshot = (tuple(loaded),tuple(loaded.values()))
 
     @property
     def pk(self):
@@ -236,7 +512,7 @@ class Model(object,metaclass=ModelMetaclass):
         pass
 
     def __repr__(self):
-        attrs = ["%s:%s" % (k,v) for k,v in self.__dict__.items()]
+        attrs = ["%s:%s" % (k,v) for k,v in self.__dict__.items() if not k.startswith("_")]
         if len(attrs) > 6:
             attrs = attrs[:6]
             attrs[-1] = '...'
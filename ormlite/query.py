@@ -1,5 +1,9 @@
-import copy
 from ormlite.base import configuration
+from ormlite.utils import chunked,encode_cursor,decode_cursor
+from ormlite.aio import run_in_executor,iterate
+from ormlite.session import get_session
+from ormlite.cache import CachedCursor
+from ormlite.expressions import Expression,Aggregate,Min,Max,Sum,Count,Avg
 
 
 def flat_converter(row,cursor):
@@ -37,28 +41,269 @@ def get_alias_converter(aliases):
 	return converter
 
 
+def execute_sql(cursor,sql,params,event=None):
+	if params:
+		cursor.execute(sql,params)
+	else:
+		cursor.execute(sql)
+	if event is not None:
+		event.executed()
+
+
+def get_rowcount(cursor):
+	return cursor.rowcount
+
+
+def execute_statement(obj,handle,cursor=None,compiled=None):
+	"""
+	编译并执行 obj(Query 或 Statement), 发送查询回调
+	handle(cursor) 读取结果, 返回读取或影响的行数
+	cursor 为 None 时从连接池取得连接, 等待连接的时间不计入编译时间; compiled 为已经编译的 (sql, params)
+	"""
+	event = configuration.start_query(obj)
+	sql, params = compiled or obj.as_sql()
+	if event is not None:
+		event.compiled(sql,params)
+	try:
+		if cursor is None:
+			with configuration.db as connection:
+				if event is not None:
+					event.acquired()
+				cursor = connection.cursor()
+				execute_sql(cursor,sql,params,event)
+				rowcount = handle(cursor)
+		else:
+			execute_sql(cursor,sql,params,event)
+			rowcount = handle(cursor)
+	except Exception as e:
+		if event is not None:
+			event.finish(exception=e)
+		raise
+	if event is not None:
+		event.finish(rowcount)
+
+
+def invalidate_cache(model):
+	#写入后使 model 和通过外键级联的 model 的查询结果缓存失效
+	cache = configuration.cache
+	if cache is None:
+		return
+	models = [model] + [field.model for field in model._opts.reverse_related.values()]
+	db = configuration.db
+	if db.in_atomic():
+		#事务中只记录, 最外层的事务提交或回滚后再失效, 否则可能缓存未提交的数据
+		db._local.dirty_models.update(models)
+		return
+	for model in models:
+		cache.invalidate(model)
+
+
+def make_where(args,kwargs):
+	#位置参数为 Where 或 Exists, 关键字参数为字段条件, 全部用 AND 连接
+	where = Where(kwargs)
+	for arg in args:
+		where &= arg if isinstance(arg,Where) else Where(arg)
+	return where
+
+
+def get_hydrator(cls,cols):
+	"""
+	返回把数据库的一行直接转换成cls实例的函数, 不经过 __init__ 的检查
+	列名到属性名的映射按列的结构计算一次, 缓存在 model._opts.hydrators
+	"""
+	cols = tuple(cols)
+	opts = cls._opts
+	hydrator = opts.hydrators.get(cols)
+	if hydrator is not None:
+		return hydrator
+	attrs = []
+	loaded = set()
+	extra = []
+	for index,col in enumerate(cols):
+		field = opts.get_column_field(col)
+		if field is None:
+			attrs.append(col)
+			extra.append((index,col))
+		else:
+			#外键保存在 "<name>_id" 属性中, 关联对象由 RelatedDescriptor 按需加载
+			attrs.append(field.get_attname())
+			loaded.add(field.name)
+	#没有查询的字段在第一次访问时再加载
+	deferred = frozenset(field.get_attname() for field in opts.fields if field.name not in loaded)
+	attrs = tuple(attrs)
+	new = object.__new__
+
+	def hydrate(values):
+		obj = new(cls)
+		attributes = dict(zip(attrs,values))
+		if deferred:
+			attributes["_deferred"] = deferred
+		#记录加载时的值, save()时只更新修改过的字段
+		attributes["_snapshot"] = (cols,values)
+		obj.__dict__ = attributes
+		return obj
+
+	hydrate.deferred = deferred
+	#不是字段的列(annotate 的别名等)
+	hydrate.extra = tuple(extra)
+	#identity map 按主键查找已有的对象
+	pk_column = opts.pk_field.get_column()
+	hydrate.pk_index = cols.index(pk_column) if pk_column in cols else None
+	opts.hydrators[cols] = hydrate
+	return hydrate
+
+
+class DeferredLoader(object):
+	#同一个结果集中的对象共用一个加载器, 第一次访问延迟字段时一次加载所有对象的延迟字段
+
+	def __init__(self,model,objs):
+		self.model = model
+		self.objs = objs
+
+	def load(self):
+		objs = [obj for obj in self.objs if obj.__dict__.get("_deferred")]
+		self.objs = []
+		load_deferred(self.model,objs)
+
+
+def load_deferred(model,objs):
+	if not objs:
+		return
+	opts = model._opts
+	pk_field = model.get_pk_field()
+	deferred = set()
+	for obj in objs:
+		deferred.update(obj.__dict__["_deferred"])
+	fields = [field for field in opts.fields if field.get_attname() in deferred]
+	columns = tuple(field.get_column() for field in fields)
+	owners = dict((obj.pk,obj) for obj in objs)
+	for chunk in chunked(owners,configuration.db.max_params):
+		query = model.object.query(**{pk_field.name + "__in":chunk})
+		for values in query.items(pk_field.name,*[field.name for field in fields]):
+			obj = owners[values[0]]
+			attributes = obj.__dict__
+			for field,value in zip(fields,values[1:]):
+				#已经被重新赋值的字段不覆盖
+				attributes.setdefault(field.get_attname(),value)
+			cols, loaded = attributes.get("_snapshot",((),()))
+			attributes["_snapshot"] = (tuple(cols) + columns,tuple(loaded) + tuple(values[1:]))
+	for obj in objs:
+		obj.__dict__.pop("_deferred",None)
+		obj.__dict__.pop("_deferred_loader",None)
+
+
+def defer_loading(model,objs):
+	loader = DeferredLoader(model,objs)
+	for obj in objs:
+		obj.__dict__["_deferred_loader"] = loader
+
+
 def get_object_converter(cls):
+	def converter(row,cursor):
+		hydrate = get_hydrator(cls,[col[0] for col in cursor.description])
+		session = get_session()
+		if session is None:
+			result = [hydrate(values) for values in row]
+		else:
+			result = [session.hydrate(cls,hydrate,values) for values in row]
+		if hydrate.deferred:
+			defer_loading(cls,result)
+		return result
+	return converter
+
+
+def get_select_related_converter(cls,related):
+	#related: [(field,related_model)], 关联表的列排在主表的列之后
+	related = [(field.get_cache_name(),rel_model,get_hydrator(rel_model,[f.get_column() for f in rel_model._opts.fields]),
+				len(rel_model._opts.fields)) for field,rel_model in related]
+	related_count = sum(count for _,_,_,count in related)
 	def converter(row,cursor):
 		result = []
 		cols = [col[0] for col in cursor.description]
+		count = len(cols) - related_count
+		hydrate = get_hydrator(cls,cols[:count])
+		session = get_session()
 		for values in row:
-			kwargs = {}
-			for k,v in zip(cols,values):
-				kwargs[k] = v
-			result.append(cls(**kwargs))
+			if session is None:
+				obj = hydrate(values[:count])
+			else:
+				obj = session.hydrate(cls,hydrate,values[:count])
+			start = count
+			for cache_name,rel_model,rel_hydrate,rel_count in related:
+				rel_values = values[start:start + rel_count]
+				start += rel_count
+				if any(v is not None for v in rel_values):
+					if session is None:
+						setattr(obj,cache_name,rel_hydrate(rel_values))
+					else:
+						setattr(obj,cache_name,session.hydrate(rel_model,rel_hydrate,rel_values))
+			result.append(obj)
+		if hydrate.deferred:
+			defer_loading(cls,result)
 		return result
 	return converter
 
 
-Min = lambda x:'MIN(`%s`)' % x
-
-Max = lambda x:'MAX(`%s`)' % x
-
-Sum = lambda x:'SUM(`%s`)' % x
-
-Count = lambda x:'COUNT(`%s`)' % x
-
-Avg = lambda x:'AVG(`%s`)' % x
+def prefetch_related_objects(model,objs,names):
+	#每个关联只用一条(按参数限制分块) WHERE ... IN (...) 查询, 结果放入关联缓存
+	if not objs:
+		return
+	for name in names:
+		field = model._opts.get_field(name)
+		if field is not None and field.is_related:
+			prefetch_forward(objs,field)
+		elif name in model._opts.reverse_related:
+			prefetch_reverse(objs,model._opts.reverse_related[name])
+		else:
+			raise ValueError("%s has no relation '%s'" % (model.__name__,name))
+
+
+def prefetch_forward(objs,field):
+	rel_model = field.get_related_model()
+	rel_name = field.get_related_field().name
+	column = field.get_column()
+	cache_name = field.get_cache_name()
+	values = set(getattr(obj,column,None) for obj in objs)
+	values.discard(None)
+	related = {}
+	for chunk in chunked(values,configuration.db.max_params):
+		for rel_obj in rel_model.object.query(**{rel_name + "__in":chunk}):
+			related[getattr(rel_obj,rel_name)] = rel_obj
+	for obj in objs:
+		setattr(obj,cache_name,related.get(getattr(obj,column,None)))
+
+
+def prefetch_reverse(objs,field):
+	model = field.model
+	rel_name = field.get_related_field().name
+	column = field.get_column()
+	cache_name = "_%s_cache" % field.get_related_name()
+	owners = {}
+	for obj in objs:
+		owners[getattr(obj,rel_name)] = obj
+	groups = {}
+	for chunk in chunked(owners,configuration.db.max_params):
+		for rel_obj in model.object.query(**{column + "__in":chunk}):
+			value = getattr(rel_obj,column)
+			setattr(rel_obj,field.get_cache_name(),owners[value])
+			groups.setdefault(value,[]).append(rel_obj)
+	for obj in objs:
+		value = getattr(obj,rel_name)
+		query = model.object.query(**{column:value})
+		query.result = groups.get(value,[])
+		setattr(obj,cache_name,query)
+
+
+class Page(list):
+	#keyset 分页的一页结果, next_cursor 为 None 时没有下一页
+
+	def __init__(self,objects,next_cursor=None):
+		super(Page,self).__init__(objects)
+		self.next_cursor = next_cursor
+
+	@property
+	def has_next(self):
+		return self.next_cursor is not None
 
 
 
@@ -74,7 +319,15 @@ class Query(object):
 		self._distinct = False
 		self._orderby = []
 		self._groupby = []
+		#分组后按聚合的别名过滤的条件
+		self._having = Where()
 		self._limit = None
+		self._select_related = []
+		self._prefetch_related = []
+		#keyset 分页的起点: (排序字段, 上一页最后一行的值)
+		self._after = None
+		#查询结果缓存的秒数, None 时使用 model 的设置
+		self._cache_ttl = None
 		self._compiler = None
 		self._converter = None
 		self._cache = None
@@ -85,24 +338,124 @@ class Query(object):
 			self._compiler = configuration.compiler
 		return self._compiler.compile(self)
 
+	def get_converter(self):
+		if self._converter is not None:
+			return self._converter
+		if self._select_related:
+			related = []
+			for name in self._select_related:
+				field = self.model._opts.get_field(name)
+				related.append((field,field.get_related_model()))
+			return get_select_related_converter(self.model,related)
+		return get_object_converter(self.model)
+
 	def execute(self):
-		if self._converter is None:
-			self._converter = get_object_converter(self.model)
-		sql, params = self.as_sql()
-		if configuration.debug:
-			s = sql.replace("?","%r")
-			configuration.logger.debug(s % params)
-		db = configuration.db
-		with db as connection:
-			cursor = connection.cursor()
-			if params:
-				cursor.execute(sql, params)
-			else:
-				cursor.execute(sql)
+		self._converter = self.get_converter()
+		ttl = self.get_cache_ttl()
+		#事务中读到的可能是未提交的数据, 不读写缓存
+		if ttl and not configuration.db.in_atomic():
+			return self.execute_cached(ttl)
+		def fetch(cursor):
 			self._cache = cursor.fetchall()
 			self.result = self._converter(self._cache,cursor)
+			return len(self._cache)
+		execute_statement(self,fetch)
+		if self._prefetch_related:
+			prefetch_related_objects(self.model,self.result,self._prefetch_related)
+		return self.result
+
+	def execute_cached(self,ttl):
+		#以编译后的 (sql, params) 和相关 model 的版本为key, 缓存数据库返回的行, 命中时重新转换成对象
+		cache = configuration.get_cache()
+		sql, params = self.as_sql()
+		key = cache.make_key(self.get_cache_models(),sql,params)
+		cached = cache.get(key)
+		if cached is None:
+			def fetch(cursor):
+				nonlocal cached
+				cached = (tuple(cursor.fetchall()),cursor.description)
+				return len(cached[0])
+			execute_statement(self,fetch,compiled=(sql,params))
+			cache.set(key,cached,ttl)
+		rows,description = cached
+		self._cache = list(rows)
+		self.result = self._converter(self._cache,CachedCursor(description))
+		if self._prefetch_related:
+			prefetch_related_objects(self.model,self.result,self._prefetch_related)
 		return self.result
 
+	def get_cache_ttl(self):
+		if self._cache_ttl is not None:
+			return self._cache_ttl
+		return self.model._opts.cache_ttl
+
+	def get_cache_models(self):
+		compiler = self._compiler or configuration.compiler
+		return compiler.get_models(self)
+
+	def cached(self,ttl=60):
+		#缓存查询结果 ttl 秒, 写入相关 model 时失效; ttl 为 0 时不缓存(包括 model 默认开启的缓存)
+		new = self.copy()
+		new._converter = self._converter
+		new._cache_ttl = ttl
+		return new
+
+	def iterator(self,chunk_size=2000):
+		#流式读取结果, 每次 fetchmany(chunk_size) 并逐块转换, 不缓存结果
+		converter = self.get_converter()
+		event = configuration.start_query(self)
+		sql, params = self.as_sql()
+		if event is not None:
+			event.compiled(sql,params)
+		db = configuration.db
+		rowcount = 0
+		error = None
+		#循环中的查询(prefetch_related, 延迟字段, 外键)不能使用流式游标所在的连接
+		with db.stream() as stream:
+			if event is not None:
+				event.acquired()
+			cursor = stream.cursor()
+			try:
+				execute_sql(cursor,sql,params,event)
+				while True:
+					rows = cursor.fetchmany(chunk_size)
+					if not rows:
+						break
+					rowcount += len(rows)
+					objs = converter(rows,cursor)
+					if self._prefetch_related:
+						prefetch_related_objects(self.model,objs,self._prefetch_related)
+					for obj in objs:
+						yield obj
+			except Exception as e:
+				error = e
+				raise
+			finally:
+				cursor.close()
+				#提前结束循环(GeneratorExit)时也要结束事件, rowcount 为已经读取的行数
+				#fetch_time 包含了调用方处理每个对象的时间
+				if event is not None:
+					event.finish(rowcount,exception=error)
+
+	async def aexecute(self):
+		return await run_in_executor(self.execute)
+
+	def aiter(self,chunk_size=2000):
+		#async for obj in query.aiter(): ...
+		return iterate(self,chunk_size)
+
+	async def aget(self,**kwargs):
+		return await run_in_executor(self.get,**kwargs)
+
+	async def acount(self):
+		return await run_in_executor(self.count)
+
+	async def adelete(self,chunk_size=None):
+		return await run_in_executor(self.delete,chunk_size)
+
+	async def apage(self,size):
+		return await run_in_executor(self.page,size)
+
 	def copy(self):
 		#克隆并返回一个新的对象
 		new = self.__class__(self.model,self._fields,self._where)
@@ -110,7 +463,18 @@ class Query(object):
 		new._distinct = self._distinct
 		new._limit = self._limit
 		new._groupby = list(self._groupby)
+		new._having = self._having.copy()
 		new._orderby = list(self._orderby)
+		new._select_related = list(self._select_related)
+		new._prefetch_related = list(self._prefetch_related)
+		new._after = self._after
+		new._cache_ttl = self._cache_ttl
+		return new
+
+	def __deepcopy__(self,memo):
+		#Where 复制条件时, 作为子查询的 Query 复制查询结构即可
+		new = self.copy()
+		new._converter = self._converter
 		return new
 
 	def __getitem__(self,value):
@@ -126,6 +490,7 @@ class Query(object):
 			return list(self.result)[value]
 		new = self.copy()
 		new._limit = value
+		new._converter = self._converter
 		new.execute()
 		if isinstance(value,int):
 			return new.result[0] if new.result else []
@@ -133,7 +498,7 @@ class Query(object):
 
 	def __bool__(self):
 		if self.result is None:
-			self.execute()
+			return self.exists()
 		return bool(self.result)
 
 	def __iter__(self):
@@ -153,6 +518,9 @@ class Query(object):
 
 	def get(self,**kwargs):
 		query = self.copy().query(**kwargs)
+		if query._limit is None:
+			#只需要知道是否有多条记录
+			query._limit = slice(0,2)
 		query.execute()
 		if not query.result:
 			raise query.model.DoesNotExists('Not query %s object record:%s' % (self.model,query._where))
@@ -163,9 +531,19 @@ class Query(object):
 	def count(self):
 		if self.result is not None:
 			return len(self.result)
+		if self._groupby:
+			#分组查询的数量为分组的数量
+			new = self.copy()
+			new._select_related = []
+			if new._limit is None:
+				new._orderby = []
+			return GroupCount(new).execute()[0][0]
 		new = self.copy()
 		new._fields = []
 		new._alias = {"count":Count(self.model.get_pk_name())}
+		new._orderby = []
+		new._select_related = []
+		new._prefetch_related = []
 		new._converter = flat_converter
 		new.execute()
 		return new.result[0]
@@ -181,6 +559,8 @@ class Query(object):
 		new = self.copy()
 		new._alias.update(kwargs)
 		new._fields = list(fields)
+		#只返回数据时不需要关联对象的列
+		new._select_related = []
 		if flat:
 			new._converter = flat_converter
 		else:
@@ -192,33 +572,238 @@ class Query(object):
 		new._fields = list(fields)
 		if kwargs:
 			new._alias.update(kwargs)
+		new._select_related = []
 		new._converter = dict_converter
 		return new
 
-	def query(self,**kwargs):
-		where = Where(kwargs)
+	def query(self,*args,**kwargs):
+		having = self.get_having(kwargs)
+		where = make_where(args,kwargs)
 		new = self.copy()
 		new._where &= where
-		new._converter = get_object_converter(self.model)
+		new._having &= Where(having)
+		new._converter = None if not self._groupby else self._converter
 		return new
 
-	def exclude(self,**kwargs):
-		where = ~Where(kwargs)
+	def exclude(self,*args,**kwargs):
+		having = self.get_having(kwargs)
 		new = self.copy()
-		new._where &= where
-		new._converter = get_object_converter(self.model)
+		if having:
+			#引用了聚合时整个条件放入 HAVING, 否则 NOT (a AND b) 会被拆开
+			having.update(kwargs)
+			new._having &= ~make_where(args,having)
+		else:
+			new._where &= ~make_where(args,kwargs)
+		new._converter = None if not self._groupby else self._converter
+		return new
+
+	def get_having(self,kwargs):
+		#分组查询中引用聚合别名的条件从 kwargs 中取出, 放入 HAVING
+		having = {}
+		if self._groupby:
+			for key in list(kwargs):
+				if key.split("__")[0] in self._alias:
+					having[key] = kwargs.pop(key)
+		return having
+
+	def only(self,*fields):
+		#只查询指定的字段(和主键), 其余字段在第一次访问时按结果集批量加载
+		opts = self.model._opts
+		for name in fields:
+			if opts.get_field(name) is None:
+				raise ValueError("%s has no field '%s'" % (self.model.__name__,name))
+		new = self.copy()
+		new._fields = [field.name for field in opts.fields if field.primary_key or field.name in fields]
+		new._converter = self._converter
+		return new
+
+	def defer(self,*fields):
+		#不查询指定的字段, 在第一次访问时按结果集批量加载
+		opts = self.model._opts
+		for name in fields:
+			field = opts.get_field(name)
+			if field is None:
+				raise ValueError("%s has no field '%s'" % (self.model.__name__,name))
+			if field.primary_key:
+				raise ValueError("Primary key '%s' cannot be deferred" % name)
+		new = self.copy()
+		names = self._fields or opts.get_fields_name()
+		new._fields = [name for name in names if name not in fields]
+		new._converter = self._converter
+		return new
+
+	def select_related(self,*fields):
+		#通过 LEFT JOIN 在同一条查询中加载外键关联的对象
+		new = self.copy()
+		for name in fields:
+			field = self.model._opts.get_field(name)
+			if field is None or not field.is_related:
+				raise ValueError("%s has no related field '%s'" % (self.model.__name__,name))
+			#values()/items()/group() 的结果不是对象, 不加载关联对象
+			if self._converter in (raw_data,flat_converter,dict_converter):
+				continue
+			if name not in new._select_related:
+				new._select_related.append(name)
+		new._converter = self._converter
+		return new
+
+	def prefetch_related(self,*names):
+		#执行查询后, 每个关联再用一条 IN 查询批量加载, 支持外键和反向关联(例如 'order_set')
+		new = self.copy()
+		for name in names:
+			field = self.model._opts.get_field(name)
+			if (field is None or not field.is_related) and name not in self.model._opts.reverse_related:
+				raise ValueError("%s has no relation '%s'" % (self.model.__name__,name))
+			if name not in new._prefetch_related:
+				new._prefetch_related.append(name)
+		new._converter = self._converter
 		return new
 
 	def group(self,*fields):
+		#按字段分组, 结果为 {字段: 值, 别名: 聚合值} 的字典, 不立即执行
 		new = self.copy()
-		new._fields.extend(fields)
+		if self._converter is None:
+			new._fields = []
+		new._fields.extend(name for name in fields if name not in new._fields)
 		new._groupby = list(fields)
+		new._select_related = []
 		new._converter = dict_converter
-		return new.execute()
+		return new
+
+	def annotate(self,**aggregates):
+		"""
+		每一行(没有分组时按主键分组)增加聚合的值, 作为对象的属性或字典的键
+			User.object.all().annotate(orders=Count('order_set')).query(orders__gt=5).sort('-orders')
+			Order.object.all().group('user').annotate(total=Sum('total'))
+		"""
+		opts = self.model._opts
+		for name,value in aggregates.items():
+			if not isinstance(value,Expression):
+				raise TypeError("annotate() argument '%s' must be an expression" % name)
+			#结果为对象时作为属性, 不能覆盖字段
+			if self._converter is None and (opts.get_field(name) is not None or name in opts.reverse_related):
+				raise ValueError("The annotation '%s' conflicts with a field on %s" % (name,self.model.__name__))
+		new = self.copy()
+		new._alias.update(aggregates)
+		if not new._groupby:
+			if self._converter is None or not self._fields:
+				new._groupby = [self.model.get_pk_name()]
+			else:
+				new._groupby = list(self._fields)
+		new._converter = self._converter
+		return new
+
+	def aggregate(self,**aggregates):
+		#在数据库中计算聚合, 只执行一条查询, 返回 {别名: 值}
+		for name,value in aggregates.items():
+			if not isinstance(value,Aggregate):
+				raise TypeError("aggregate() argument '%s' must be an aggregate" % name)
+		if self._groupby:
+			raise ValueError("aggregate() cannot be used on a grouped query")
+		if self._limit is not None:
+			raise ValueError("Cannot aggregate a sliced query")
+		new = self.copy()
+		new._fields = []
+		new._alias = aggregates
+		new._orderby = []
+		new._select_related = []
+		new._prefetch_related = []
+		new._converter = dict_converter
+		new.execute()
+		return new.result[0]
+
+	async def aaggregate(self,**aggregates):
+		return await run_in_executor(self.aggregate,**aggregates)
 
 	def update(self,**update_fields):
-		update = Update(model=self.model,update_fields=update_fields,where=self.where)
-		update.execute()
+		#值可以是 F 表达式, 例如 update(stock=F('stock') - 1), 返回更新的行数
+		update = Update(model=self.model,update_fields=update_fields,where=self._where or None)
+		rowcount = update.execute()
+		session = get_session()
+		if session is not None:
+			#identity map 中的对象已经过期
+			session.clear(self.model)
+		return rowcount
+
+	def delete(self,chunk_size=None):
+		"""
+		删除查询到的全部行, 不加载对象, 返回删除的行数
+		:param chunk_size: 按主键范围分批删除, 每批最多 chunk_size 行, 不在事务中时每批单独提交, 缩短大表上锁的时间
+		"""
+		if not self._where:
+			raise ValueError("delete() requires query conditions")
+		if self._limit is not None:
+			raise TypeError("Cannot delete a sliced query")
+		session = get_session()
+		if session is not None:
+			session.clear(self.model)
+		if not chunk_size:
+			return Delete(model=self.model,where=self._where).execute()
+		pk_name = self.model.get_pk_name()
+		where = self._where
+		rowcount = 0
+		while True:
+			#找到这一批最后一行的主键, 删除 (上一批的主键, 这一批的主键] 范围内符合条件的行
+			bound = Query(self.model,where=where).items(pk_name,flat=True).sort(pk_name)[chunk_size - 1:chunk_size]
+			if not bound:
+				return rowcount + Delete(model=self.model,where=where).execute()
+			rowcount += Delete(model=self.model,where=where & Where({pk_name + "__le":bound[0]})).execute()
+			where = self._where & Where({pk_name + "__gt":bound[0]})
+
+	def after(self,cursor):
+		#从 page() 返回的游标之后继续查询, cursor 为 None 时从第一页开始
+		new = self.copy()
+		new._converter = self._converter
+		new._after = decode_cursor(cursor) if cursor else None
+		return new
+
+	def page(self,size):
+		"""
+		keyset 分页, 生成 WHERE (a,b) > (?,?) 而不是 OFFSET, 翻到多深的页耗时都不变
+			page = Order.object.all().sort('created_time','id').after(cursor).page(100)
+			page.next_cursor #下一页的游标, 没有下一页时为 None
+		排序字段的值不能为 NULL, 排序字段中没有主键时会加上主键保证顺序唯一
+		"""
+		if self._limit is not None:
+			raise TypeError("Cannot page a sliced query")
+		new = self.copy()
+		new._converter = self._converter
+		new._orderby = self.get_keyset_order()
+		if new._after is not None and new._after[0] != new._orderby:
+			raise ValueError("Cursor was created for ordering %s, not %s" % (new._after[0],new._orderby))
+		new._limit = slice(0,size + 1)
+		new.execute()
+		objects = new.result[:size]
+		next_cursor = None
+		if len(new.result) > size:
+			next_cursor = encode_cursor(new._orderby,new.get_cursor_values(objects[-1]))
+		return Page(objects,next_cursor)
+
+	def get_keyset_order(self):
+		pk_name = self.model.get_pk_name()
+		orderby = list(self._orderby)
+		if pk_name not in [name.lstrip("-") for name in orderby]:
+			desc = bool(orderby) and orderby[-1].startswith("-")
+			orderby.append("-" + pk_name if desc else pk_name)
+		return orderby
+
+	def get_cursor_values(self,row):
+		#从一行结果中取出排序字段的值, items()/values() 需要查询排序字段
+		values = []
+		for name in self._orderby:
+			name = name.lstrip("-")
+			if isinstance(row,self.model):
+				field = self.model._opts.get_field(name)
+				values.append(getattr(row,field.get_attname() if field else name))
+			elif isinstance(row,dict) and name in row:
+				values.append(row[name])
+			elif isinstance(row,tuple) and name in self._fields:
+				values.append(row[self._fields.index(name)])
+			elif not isinstance(row,(dict,tuple)) and self._fields == [name]:
+				values.append(row)
+			else:
+				raise ValueError("Sort field '%s' must be selected to page the query" % name)
+		return values
 
 	def first(self):
 		return self[0]
@@ -236,13 +821,24 @@ class Query(object):
 					new_orderby.append("-" + field_name)
 			new._orderby = new_orderby
 		else:
-			new._orderby = ['-id']
+			new._orderby = ['-' + self.model.get_pk_name()]
 		return new.first()
 
 	def exists(self):
-		if self.result is None:
-			self.execute()
-		return bool(self.result)
+		#SELECT 1 ... LIMIT 1, 不创建对象
+		if self.result is not None:
+			return bool(self.result)
+		new = self.copy()
+		new._fields = []
+		if not new._having:
+			new._alias = {}
+		new._orderby = []
+		new._select_related = []
+		new._prefetch_related = []
+		new._limit = slice(0,1)
+		new._converter = raw_data
+		new.execute()
+		return bool(new.result)
 
 
 class Where(object):
@@ -297,12 +893,14 @@ class Where(object):
 		return self.copy()
 
 	def copy(self):
+		#只复制条件的结构, 条件中的值(model 实例, 子查询等)不会被修改, 不用深复制
 		new = self.__class__()
-		new.buf = copy.deepcopy(self.buf)
+		new.buf = [node.copy() if isinstance(node,(Where,dict)) else node for node in self.buf]
 		return new
 
 	def brackets(self):
-		if len(self.buf) > 1:
+		#一个字典中的多个条件也是用 AND 连接的
+		if len(self.buf) > 1 or (self.buf and isinstance(self.buf[0],dict) and len(self.buf[0]) > 1):
 			self.buf.insert(0,"(")
 			self.buf.append(")")
 
@@ -317,6 +915,7 @@ class Statement(object):
 		self.where = where
 		self.compiler = None
 		self.converter = None
+		self.rowcount = None
 
 	def as_sql(self):
 		if self.compiler is None:
@@ -324,24 +923,26 @@ class Statement(object):
 		return self.compiler.compile(self)
 
 	def execute(self,db=None):
-		sql, params = self.as_sql()
-		if configuration.debug:
-			s = sql.replace("?",'%r')
-			configuration.logger.debug(s % params)
-		db = configuration.db
 		result = []
-		with db as connection:
-			cursor = connection.cursor()
-			if params:
-				cursor.execute(sql,params)
-			else:
-				cursor.execute(sql)
+		def fetch(cursor):
+			self.rowcount = cursor.rowcount
 			if callable(self.converter):
-				result = self.converter(cursor.fetchall(),cursor)
+				result.extend(self.converter(cursor.fetchall(),cursor))
 			else:
-				result = cursor.fetchall()
+				result.extend(cursor.fetchall())
+			return self.rowcount
+		execute_statement(self,fetch)
 		return result
 
+	def execute_rowcount(self):
+		#执行写入语句, 返回影响的行数
+		def fetch(cursor):
+			self.rowcount = cursor.rowcount
+			return self.rowcount
+		execute_statement(self,fetch)
+		invalidate_cache(self.model)
+		return self.rowcount
+
 	def add_where(self,kwargs):
 		where = Where(kwargs)
 		if self.where:
@@ -353,6 +954,15 @@ class Statement(object):
 		return "<%s object>" % self.__class__.__name__
 
 
+class GroupCount(Statement):
+	#SELECT COUNT(*) FROM (分组查询)
+	statement = "GROUP_COUNT"
+
+	def __init__(self,query):
+		super(GroupCount,self).__init__(query.model)
+		self.query = query
+
+
 class Update(Statement):
 	statement = "UPDATE"
 
@@ -361,41 +971,120 @@ class Update(Statement):
 		self.update_fields = update_fields
 
 	def execute(self,db=None):
-		sql, params = self.as_sql()
-		if configuration.debug:
-			s = sql.replace("?",'%r')
-			configuration.logger.debug(s % params)
-		db = configuration.db
-		with db as connection:
-			cursor = connection.cursor()
-			if params:
-				cursor.execute(sql,params)
-			else:
-				cursor.execute(sql)
-
+		return self.execute_rowcount()
 
 
 class Insert(Statement):
 	statement = "INSERT"
 
 	def execute(self,db=None):
-		sql, params = self.as_sql()
-		if configuration.debug:
-			placeholder = configuration.db.placeholder
-			s = sql.replace(placeholder,'%r')
-			configuration.logger.debug(s % params)
-		db = configuration.db
-		with db as connection:
-			cursor = connection.cursor()
-			cursor.execute(sql,params)
+		def fetch(cursor):
 			self.lastrowid = cursor.lastrowid
+			self.rowcount = cursor.rowcount
+			return self.rowcount
+		execute_statement(self,fetch)
+		invalidate_cache(self.model)
 		return self.lastrowid
 
 	def get_id(self):
 		return getattr(self,"lastrowid",None)
 
 
+class BulkInsert(Insert):
+	statement = "BULK_INSERT"
+
+	def __init__(self,model,instances,batch_size=None):
+		super(BulkInsert,self).__init__(model)
+		self.instances = list(instances)
+		self.batch_size = batch_size
+		self.batch = []
+
+	def get_batch_size(self,db):
+		#每个批次的参数数量不能超过数据库的限制
+		max_size = max(db.max_params // len(self.model._opts.fields),1)
+		if self.batch_size:
+			return min(self.batch_size,max_size)
+		return max_size
+
+	def execute(self,db=None):
+		db = configuration.db
+		pk_name = self.model.get_pk_name()
+		batch_size = self.get_batch_size(db)
+		self.rowcount = 0
+		with db.atomic() as connection:
+			cursor = connection.cursor()
+			for start in range(0,len(self.instances),batch_size):
+				self.batch = self.instances[start:start + batch_size]
+				auto_pk = all(getattr(obj,pk_name) is None for obj in self.batch)
+				execute_statement(self,get_rowcount,cursor)
+				self.rowcount += max(cursor.rowcount,0)
+				if auto_pk:
+					self.set_batch_ids(db,cursor,pk_name)
+		self.batch = []
+		invalidate_cache(self.model)
+		return self.instances
+
+	def set_batch_ids(self,db,cursor,pk_name):
+		ids = db.get_bulk_insert_ids(cursor,len(self.batch))
+		if ids:
+			for obj,pk in zip(self.batch,ids):
+				setattr(obj,pk_name,pk)
+
+
+class BulkUpsert(BulkInsert):
+	"""
+	插入, 和已有的行冲突时更新 update_fields 中的字段
+	sqlite: INSERT ... ON CONFLICT(conflict_fields) DO UPDATE SET ...
+	mysql:  INSERT ... ON DUPLICATE KEY UPDATE ...
+	update_fields 为空时冲突的行保持不变
+	"""
+	statement = "BULK_UPSERT"
+
+	def __init__(self,model,instances,conflict_fields=None,update_fields=None,batch_size=None):
+		super(BulkUpsert,self).__init__(model,instances,batch_size)
+		self.conflict_fields = list(conflict_fields or [])
+		self.update_fields = list(update_fields or [])
+
+	def set_batch_ids(self,db,cursor,pk_name):
+		#更新已有行时不会产生新的id, 只有单行且确定插入了新行时才回填主键
+		if not self.update_fields and len(self.batch) == 1 and cursor.rowcount == 1:
+			setattr(self.batch[0],pk_name,cursor.lastrowid)
+
+
+class BulkUpdate(Update):
+	statement = "BULK_UPDATE"
+
+	def __init__(self,model,instances,fields,batch_size=None):
+		super(BulkUpdate,self).__init__(model,fields=list(fields))
+		self.instances = list(instances)
+		self.batch_size = batch_size
+		self.batch = []
+
+	def get_batch_size(self,db):
+		#每个对象需要 2 * 字段数 + 1 个参数
+		max_size = max(db.max_params // (2 * len(self.fields) + 1),1)
+		if self.batch_size:
+			return min(self.batch_size,max_size)
+		return max_size
+
+	def execute(self,db=None):
+		db = configuration.db
+		batch_size = self.get_batch_size(db)
+		self.rowcount = 0
+		with db.atomic() as connection:
+			cursor = connection.cursor()
+			for start in range(0,len(self.instances),batch_size):
+				self.batch = self.instances[start:start + batch_size]
+				execute_statement(self,get_rowcount,cursor)
+				self.rowcount += cursor.rowcount
+		self.batch = []
+		invalidate_cache(self.model)
+		return self.rowcount
+
+
 class Delete(Statement):
 	statement = "DELETE"
-	pass
+
+	def execute(self,db=None):
+		return self.execute_rowcount()
 
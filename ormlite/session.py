@@ -0,0 +1,73 @@
+import contextvars
+
+
+_current_session = contextvars.ContextVar("ormlite_session",default=None)
+
+
+def get_session():
+    #当前上下文中开启的 session, 没有时为 None
+    return _current_session.get()
+
+
+class Session(object):
+    """
+    identity map, 同一个 session 中 (model, 主键) 相同的行只对应一个对象
+    按主键 get() 和外键访问先查找 identity map, 已经在 map 中的行不会再次创建对象
+    通过 contextvars 按线程/协程隔离, 调用 clear() 或最外层的事务结束时清空
+        with Session():
+            for order in Order.object.all():
+                order.goods #同一个 goods 只查询一次
+    """
+
+    def __init__(self):
+        self.identity_map = {}
+        self._tokens = []
+
+    def get(self,model,pk):
+        return self.identity_map.get((model,pk))
+
+    def add(self,obj):
+        if obj.pk is not None:
+            self.identity_map[(obj.__class__,obj.pk)] = obj
+
+    def discard(self,model,pk):
+        self.identity_map.pop((model,pk),None)
+
+    def hydrate(self,model,hydrate,values):
+        #主键已经在 map 中时返回已有的对象, 不再创建
+        index = hydrate.pk_index
+        if index is None:
+            return hydrate(values)
+        key = (model,values[index])
+        obj = self.identity_map.get(key)
+        if obj is None:
+            obj = hydrate(values)
+            self.identity_map[key] = obj
+        else:
+            #已有的对象也要带上这次查询的额外列, 比如 annotate 的结果
+            attributes = obj.__dict__
+            for index,attr in hydrate.extra:
+                attributes[attr] = values[index]
+        return obj
+
+    def clear(self,model=None):
+        if model is None:
+            self.identity_map.clear()
+            return
+        for key in [key for key in self.identity_map if key[0] is model]:
+            self.identity_map.pop(key,None)
+
+    def __len__(self):
+        return len(self.identity_map)
+
+    def __enter__(self):
+        self._tokens.append(_current_session.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc_instance, traceback):
+        _current_session.reset(self._tokens.pop())
+        if not self._tokens:
+            self.clear()
+
+    def __repr__(self):
+        return "<Session objects:%s>" % len(self.identity_map)
@@ -0,0 +1,121 @@
+import base64
+import binascii
+import datetime
+import decimal
+import json
+import threading
+from collections import OrderedDict
+
+
+def chunked(items,size):
+    #按 size 把序列切分成多个列表
+    items = list(items)
+    for start in range(0,len(items),size):
+        yield items[start:start + size]
+
+
+#游标中需要保留类型的值
+_cursor_types = (
+    ("dt", datetime.datetime, datetime.datetime.fromisoformat),
+    ("d", datetime.date, datetime.date.fromisoformat),
+    ("t", datetime.time, datetime.time.fromisoformat),
+)
+
+
+def _encode_value(value):
+    for tag,cls,_ in _cursor_types:
+        if isinstance(value,cls):
+            return {tag: value.isoformat()}
+    if isinstance(value,decimal.Decimal):
+        return {"dec": str(value)}
+    if isinstance(value,bytes):
+        return {"b": base64.b64encode(value).decode("ascii")}
+    return value
+
+
+def _decode_value(value):
+    if not isinstance(value,dict):
+        return value
+    (tag,value), = value.items()
+    for _tag,_,parse in _cursor_types:
+        if tag == _tag:
+            return parse(value)
+    if tag == "dec":
+        return decimal.Decimal(value)
+    if tag == "b":
+        return base64.b64decode(value)
+    raise ValueError("Unknown cursor value type '%s'" % tag)
+
+
+def encode_cursor(orderby,values):
+    #把排序字段和最后一行的值编码成不透明的字符串, 可以放在url中
+    data = json.dumps([list(orderby),[_encode_value(v) for v in values]],separators=(",",":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        orderby,values = json.loads(data.decode("utf-8"))
+        return list(orderby),[_decode_value(v) for v in values]
+    except (TypeError,ValueError,binascii.Error) as e:
+        raise ValueError("Invalid cursor:%r" % (cursor,)) from e
+
+
+class LRUCache(object):
+    """
+    线程安全的LRU缓存
+    :param maxsize: 最多保存的条目数, 超出后淘汰最久未使用的条目
+    """
+
+    def __init__(self,maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self,key,default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self,key,value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self,key):
+        with self._lock:
+            self._data.pop(key,None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return "<LRUCache size:%s maxsize:%s>" % (len(self._data),self.maxsize)
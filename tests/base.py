@@ -0,0 +1,73 @@
+import contextlib
+import io
+import unittest
+import ormlite
+from ormlite import configuration
+from ormlite.db.utils import create_tables
+
+
+class User(ormlite.Model):
+    id = ormlite.PrimaryKey()
+    name = ormlite.CharField(max_length=50)
+    sex = ormlite.CharField(max_length=1)
+    birthday = ormlite.DateField()
+
+
+class Goods(ormlite.Model):
+    id = ormlite.PrimaryKey()
+    name = ormlite.CharField(max_length=100,default='11')
+    price = ormlite.FloatField(default=0.0)
+
+
+class Order(ormlite.Model):
+    id = ormlite.PrimaryKey(null=False)
+    user = ormlite.ForeignKey(User,on_delete=ormlite.CASCADE)
+    goods = ormlite.ForeignKey(Goods,on_delete=ormlite.CASCADE)
+    amount = ormlite.IntegerField(default=0)
+    total = ormlite.FloatField(default=0.0)
+
+
+MODELS = [User,Goods,Order]
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    每个测试使用新的 sqlite :memory: 数据库, self.queries 记录执行的SQL
+        with self.capture() as queries:
+            User.object.get(id=1)
+    """
+
+    database = ":memory:"
+
+    def setUp(self):
+        configuration.conf_db({"ENGINE":"ormlite.db.sqlite3","NAME":self.database})
+        configuration.set_cache(None)
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_tables(MODELS,configuration.db)
+        self.queries = []
+        self.listener = configuration.instrument.connect(before=self.queries.append)
+        self.create_data()
+        del self.queries[:]
+
+    def tearDown(self):
+        configuration.instrument.disconnect(self.listener)
+        configuration.db.close()
+
+    def create_data(self):
+        users = User.object.bulk_create([User(name="u%d" % i,sex="MF"[i % 2]) for i in range(5)])
+        goods = Goods.object.bulk_create([Goods(name="g%d" % i,price=float(i)) for i in range(3)])
+        orders = []
+        for i in range(10):
+            order = Order(amount=i,total=float(i * 10))
+            order.user = users[i % 5]
+            order.goods = goods[i % 3]
+            orders.append(order)
+        Order.object.bulk_create(orders)
+
+    @contextlib.contextmanager
+    def capture(self):
+        #只返回块中执行的SQL
+        start = len(self.queries)
+        queries = []
+        yield queries
+        queries.extend(event.sql for event in self.queries[start:])
@@ -0,0 +1,40 @@
+from ormlite import F,Sum,Count,Session
+from tests.base import DatabaseTestCase,User,Order
+
+
+class AggregateTest(DatabaseTestCase):
+
+    def test_aggregate(self):
+        with self.capture() as queries:
+            result = Order.object.all().aggregate(total=Sum("total"),count=Count())
+        self.assertEqual(result,{"total":450.0,"count":10})
+        self.assertEqual(queries,["SELECT SUM(`total`) AS `total`, COUNT(*) AS `count` FROM `Order` ;"])
+
+    def test_group_annotate(self):
+        query = Order.object.all().group("user").annotate(total=Sum("total")).query(total__gt=60).sort("-total")
+        self.assertEqual(list(query),[{"user_id":5,"total":130.0},{"user_id":4,"total":110.0},
+                                      {"user_id":3,"total":90.0},{"user_id":2,"total":70.0}])
+        self.assertEqual(query[0:1],[{"user_id":5,"total":130.0}])
+
+    def test_group_selected_field(self):
+        query = Order.object.values("user").group("user").annotate(n=Count())
+        self.assertTrue(query.as_sql()[0].startswith("SELECT `user_id`, COUNT(*) AS `n` FROM"),query.as_sql()[0])
+
+    def test_group_count(self):
+        query = Order.object.all().group("user").annotate(total=Sum("total")).query(total__gt=60)
+        with self.capture() as queries:
+            self.assertEqual(query.count(),4)
+        self.assertEqual(len(queries),1)
+        self.assertTrue(queries[0].startswith("SELECT COUNT(*) FROM (SELECT `user_id`"),queries[0])
+
+    def test_annotate_objects(self):
+        users = User.object.all().annotate(n=Count("order_set"),spent=Sum(F("order_set__total"))).sort("id")
+        self.assertEqual([(user.name,user.n,user.spent) for user in users][:2],[("u0",2,50.0),("u1",2,70.0)])
+        self.assertEqual(users.count(),5)
+
+    def test_annotate_in_session(self):
+        with Session():
+            user = User.object.get(id=1)
+            annotated = User.object.all().annotate(n=Count("order_set")).query(id=1)[0]
+            self.assertIs(annotated,user)
+            self.assertEqual(annotated.n,2)
@@ -0,0 +1,68 @@
+import sqlite3
+from ormlite import configuration
+from tests.base import DatabaseTestCase,User,Order
+
+
+class AtomicTest(DatabaseTestCase):
+
+    def test_nested_rollback(self):
+        db = configuration.db
+        with db.atomic():
+            User.object.create(name="outer",sex="M")
+            with self.assertRaises(ValueError):
+                with db.atomic():
+                    User.object.create(name="inner",sex="M")
+                    raise ValueError()
+            User.object.create(name="after",sex="M")
+        names = set(User.object.query(name__in=["outer","inner","after"]).items("name",flat=True))
+        self.assertEqual(names,{"outer","after"})
+
+    def test_outer_rollback(self):
+        db = configuration.db
+        with self.assertRaises(ValueError):
+            with db.atomic():
+                with db.atomic():
+                    User.object.create(name="inner",sex="M")
+                raise ValueError()
+        self.assertFalse(User.object.query(name="inner").exists())
+
+    def test_decorator(self):
+        db = configuration.db
+
+        @db.atomic()
+        def create(name,fail=False):
+            User.object.create(name=name,sex="M")
+            if fail:
+                raise ValueError()
+
+        create("ok")
+        with self.assertRaises(ValueError):
+            create("failed",fail=True)
+        self.assertTrue(User.object.query(name="ok").exists())
+        self.assertFalse(User.object.query(name="failed").exists())
+
+    def test_no_commit_per_statement(self):
+        db = configuration.db
+        with db.atomic() as connection:
+            user = User.object.create(name="new",sex="M")
+            self.assertTrue(connection.in_transaction)
+            user.sex = "F"
+            user.save()
+            Order.object.query(user=user).delete()
+            #语句执行后没有提交, 事务仍然没有结束
+            self.assertTrue(connection.in_transaction)
+        self.assertFalse(connection.in_transaction)
+
+    def test_commit_failure_discards_connection(self):
+        db = configuration.db
+        with db as connection:
+            connection.execute("PRAGMA foreign_keys = ON")
+        with self.assertRaises(sqlite3.IntegrityError):
+            with db.atomic() as connection:
+                #外键检查推迟到提交时, 提交失败
+                connection.execute("PRAGMA defer_foreign_keys = ON")
+                connection.execute('INSERT INTO "Order" ("user_id","goods_id") VALUES (999,999)')
+        #提交失败的连接状态不确定, 不再放回连接池
+        self.assertEqual(db.pool.stats()["closed"],1)
+        with db as new_connection:
+            self.assertIsNot(new_connection,connection)
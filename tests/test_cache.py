@@ -0,0 +1,32 @@
+from ormlite import configuration
+from tests.base import DatabaseTestCase,User
+
+
+class ResultCacheTest(DatabaseTestCase):
+
+    def names(self):
+        return list(User.object.query(sex="F").cached(60).items("name",flat=True))
+
+    def test_invalidate_on_write(self):
+        self.assertEqual(self.names(),["u1","u3"])
+        with self.capture() as queries:
+            self.names()
+        self.assertEqual(queries,[])
+        User.object.query(id=2).update(name="x")
+        self.assertEqual(self.names(),["x","u3"])
+
+    def test_rollback(self):
+        self.assertEqual(self.names(),["u1","u3"])
+        with self.assertRaises(RuntimeError):
+            with configuration.db.atomic():
+                User.object.query(id=2).update(name="ROLLEDBACK")
+                #事务中不使用缓存, 读到未提交的数据但不缓存
+                self.assertEqual(self.names(),["ROLLEDBACK","u3"])
+                raise RuntimeError
+        self.assertEqual(self.names(),["u1","u3"])
+
+    def test_commit(self):
+        self.assertEqual(self.names(),["u1","u3"])
+        with configuration.db.atomic():
+            User.object.query(id=2).update(name="x")
+        self.assertEqual(self.names(),["x","u3"])
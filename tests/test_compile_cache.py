@@ -0,0 +1,50 @@
+from ormlite import configuration,F,Exists,OuterRef,Sum,Count,Max
+from ormlite.compiler import Compiler
+from ormlite.query import Where
+from tests.base import DatabaseTestCase,User,Order
+
+
+def limit(query,start,stop):
+    #切片会立即执行查询, 直接设置 LIMIT
+    query._limit = slice(start,stop)
+    return query
+
+
+class CompileCacheTest(DatabaseTestCase):
+    #命中SQL编译缓存时收集的参数必须和不使用缓存编译的结果相同
+
+    def get_queries(self):
+        return [
+            User.object.query(name="u1",sex__in=["M","F"]),
+            limit(User.object.query(Where({"name":"u1"}) | Where({"id__gt":3})).sort("-id"),0,2),
+            Order.object.query(total__gt=F("amount") * 2 + 1),
+            Order.object.query(user__name="u1",goods__price__ge=1),
+            Order.object.query(user__in=User.object.query(sex="F")),
+            User.object.query(Exists(Order.object.query(user=OuterRef("id"),total__gt=50))),
+            Order.object.all().sort("amount","id").after(None),
+            Order.object.values("id",t=F("total") * 2).query(t__gt=5),
+            Order.object.all().group("user").annotate(s=Sum(F("total") * 2)).query(s__gt=100,user_id__gt=1),
+            User.object.all().annotate(n=Count("order_set"),m=Max(F("order_set__total") + 1)).query(n__gt=0),
+        ]
+
+    def test_cached_params(self):
+        compiler = Compiler(configuration.db,cache_size=0)
+        for query in self.get_queries():
+            expected = compiler.compile(query)
+            self.assertEqual(configuration.compiler.compile(query),expected)
+            #第二次命中缓存
+            self.assertEqual(configuration.compiler.compile(query),expected)
+
+    def test_cached_execute(self):
+        for query in self.get_queries():
+            #Model 没有实现比较, 比较 repr
+            first = [repr(row) for row in query.copy()]
+            self.assertEqual([repr(row) for row in query.copy()],first)
+
+    def test_copy_keeps_condition_values(self):
+        #复制查询时条件中的 model 实例不被深复制
+        user = User.object.get(id=1)
+        where = (Where({"user":user}) | Where({"amount__gt":0})).copy()
+        self.assertIs(where.buf[0]["user"],user)
+        query = Order.object.query(where).query(amount__lt=5)
+        self.assertEqual(query.count(),5)
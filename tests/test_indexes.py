@@ -0,0 +1,39 @@
+import ormlite
+from ormlite import configuration
+from ormlite.db.sqlite3.table import Table
+from ormlite.db.utils import get_missing_indexes
+from tests.base import DatabaseTestCase,User
+
+
+class Ledger(ormlite.Model):
+    id = ormlite.PrimaryKey()
+    user = ormlite.ForeignKey(User,on_delete=ormlite.CASCADE,related_name="ledgers")
+    code = ormlite.CharField(max_length=20,db_index=True)
+    amount = ormlite.IntegerField(default=0)
+    idx_user_positive = ormlite.Index("user","amount",where='"amount" > 0')
+    idx_code_positive = ormlite.Index("code",where='"amount" > 0')
+
+
+class PartialIndexTest(DatabaseTestCase):
+
+    def test_partial_index_does_not_cover_field(self):
+        #部分索引之外, 外键和 db_index 的字段仍然有自己的索引
+        indexes = dict((index.get_name(),index) for index in Ledger._opts.indexes)
+        self.assertEqual(sorted(indexes),["idx_Ledger_code","idx_Ledger_code_partial",
+                                           "idx_Ledger_user_id","idx_Ledger_user_id_amount_partial"])
+        self.assertTrue(indexes["idx_Ledger_user_id"].auto)
+        self.assertIn('CREATE INDEX IF NOT EXISTS "idx_Ledger_code" ON "Ledger" ("code");',Table(Ledger).as_sql_indexes())
+
+    def test_missing_indexes_ignore_partial(self):
+        table = Table(Ledger)
+        with configuration.db as connection:
+            connection.execute(table.as_sql_create())
+            for index in Ledger._opts.indexes:
+                if index.where:
+                    connection.execute(table.as_sql_index(index))
+        missing = get_missing_indexes([Ledger],configuration.db)
+        self.assertEqual(sorted(index.get_name() for index in missing[Ledger]),["idx_Ledger_code","idx_Ledger_user_id"])
+        with configuration.db as connection:
+            for sql in table.as_sql_indexes():
+                connection.execute(sql)
+        self.assertEqual(get_missing_indexes([Ledger],configuration.db),{})
@@ -0,0 +1,53 @@
+import time
+from ormlite import configuration
+from tests.base import DatabaseTestCase,User,Order
+
+
+class InstrumentTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(InstrumentTest,self).setUp()
+        self.events = []
+        self.after = configuration.instrument.connect(after=self.events.append)
+
+    def tearDown(self):
+        configuration.instrument.disconnect(self.after)
+        super(InstrumentTest,self).tearDown()
+
+    def test_acquire_time_not_in_compile_time(self):
+        pool = configuration.db.pool
+        acquire = pool.acquire
+        def slow_acquire():
+            time.sleep(0.05)
+            return acquire()
+        pool.acquire = slow_acquire
+        try:
+            User.object.query(name="u1").count()
+        finally:
+            del pool.acquire
+        event = self.events[-1]
+        self.assertGreaterEqual(event.acquire_time,0.05)
+        self.assertLess(event.compile_time,0.05)
+        self.assertEqual(event.rowcount,1)
+
+    def test_statements(self):
+        User.object.query(id=1).update(name="x")
+        Order.object.query(amount__gt=7).delete()
+        User.object.bulk_create([User(name="a",sex="M"),User(name="b",sex="F")])
+        self.assertEqual([(e.statement,e.rowcount) for e in self.events],
+                         [("UPDATE",1),("DELETE",2),("BULK_INSERT",2)])
+        self.assertEqual(self.queries[0].sql,"UPDATE `User` SET `name` = ? WHERE `id` = ? ;")
+
+    def test_exception(self):
+        with self.assertRaises(Exception):
+            User.object.query(nothing=1).count()
+        self.assertIsNotNone(self.events[-1].exception)
+
+    def test_iterator_closed_early(self):
+        iterator = Order.object.all().iterator(chunk_size=3)
+        next(iterator)
+        iterator.close()
+        event = self.events[-1]
+        self.assertEqual(event.sql,Order.object.all().as_sql()[0])
+        self.assertEqual(event.rowcount,3)
+        self.assertIsNone(event.exception)
@@ -0,0 +1,60 @@
+import asyncio
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from ormlite import configuration
+from tests.base import DatabaseTestCase,User,Order
+
+
+class StreamTest(DatabaseTestCase):
+    #文件数据库的连接池可以有多个连接, 模拟 mysql 非缓冲游标占用连接的情况
+
+    def setUp(self):
+        fd, self.database = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        super(StreamTest,self).setUp()
+        configuration.db.stream_dedicated = True
+
+    def tearDown(self):
+        super(StreamTest,self).tearDown()
+        os.remove(self.database)
+
+    def test_dedicated_connection(self):
+        db = configuration.db
+        names = []
+        for order in Order.object.all().prefetch_related("goods").iterator(chunk_size=3):
+            #流式游标的连接不是线程的当前连接, 循环中的查询使用另一个连接
+            self.assertIsNone(db.connector)
+            self.assertEqual(db.pool.stats()["in_use"],1)
+            names.append(order.user.name)
+        self.assertEqual(len(names),10)
+        self.assertEqual(db.pool.stats()["in_use"],0)
+
+    def test_atomic_uses_transaction_connection(self):
+        db = configuration.db
+        with db.atomic():
+            User.object.create(name="new",sex="M")
+            names = [user.name for user in User.object.all().iterator()]
+            self.assertEqual(db.pool.stats()["in_use"],1)
+        self.assertIn("new",names)
+
+    def test_close_early(self):
+        iterator = Order.object.all().iterator(chunk_size=2)
+        next(iterator)
+        iterator.close()
+        self.assertEqual(configuration.db.pool.stats()["in_use"],0)
+
+    def test_aiter_awaits_query(self):
+        #只有一个工作线程时, 读取线程不能占用它
+        configuration.executor = ThreadPoolExecutor(max_workers=1)
+
+        async def main():
+            names = []
+            async for order in Order.object.all().sort("id").aiter(chunk_size=3):
+                user = await User.object.aget(id=order.user_id)
+                names.append(user.name)
+            return names
+
+        names = asyncio.run(asyncio.wait_for(main(),timeout=5))
+        self.assertEqual(names,["u%d" % (i % 5) for i in range(10)])
+        self.assertEqual(configuration.db.pool.stats()["in_use"],0)
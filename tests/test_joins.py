@@ -0,0 +1,46 @@
+from ormlite.query import Where
+from tests.base import DatabaseTestCase,Goods,Order
+
+
+class LookupJoinTest(DatabaseTestCase):
+
+    def setUp(self):
+        super(LookupJoinTest,self).setUp()
+        #没有用户的订单
+        Order.object.create(goods=Goods.object.get(id=1),amount=1,total=1.0)
+        del self.queries[:]
+
+    def test_and_uses_inner_join(self):
+        with self.capture() as queries:
+            count = Order.object.query(user__name="u1",amount__gt=0).count()
+        self.assertEqual(count,2)
+        self.assertIn("INNER JOIN `User` AS `Order__user`",queries[0])
+
+    def test_or_uses_left_join(self):
+        with self.capture() as queries:
+            count = Order.object.query(Where({"user__name":"u1"}) | Where({"amount":1})).count()
+        self.assertEqual(count,3)
+        self.assertIn("LEFT JOIN `User` AS `Order__user`",queries[0])
+
+    def test_not_uses_left_join(self):
+        #没有用户的订单: NOT (NULL AND FALSE) 为真, INNER JOIN 时会被丢掉
+        query = Order.object.query(amount__le=1).exclude(user__name="u2",amount__gt=1)
+        self.assertIn("LEFT JOIN",query.as_sql()[0])
+        self.assertEqual(query.count(),3)
+
+    def test_required_lookup_upgrades_join(self):
+        where = Where({"user__name":"u1"}) | Where({"amount":1})
+        query = Order.object.query(where,user__sex="F")
+        self.assertIn("INNER JOIN `User` AS `Order__user`",query.as_sql()[0])
+        self.assertEqual(query.count(),2)
+
+    def test_select_related_stays_left(self):
+        orders = Order.object.all().select_related("user").sort("id")
+        self.assertIn("LEFT JOIN",orders.as_sql()[0])
+        self.assertIsNone(list(orders)[-1].user)
+
+    def test_values_drops_select_related(self):
+        query = Order.object.all().select_related("user").sort("id")
+        for rows in (query.values("amount"),query.items("amount",flat=True),query.values("amount").select_related("goods")):
+            self.assertEqual(rows.as_sql()[0],"SELECT `amount` FROM `Order` ORDER BY `id` ;")
+        self.assertEqual(list(query.values("amount"))[:2],[{"amount":0},{"amount":1}])
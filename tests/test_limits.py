@@ -0,0 +1,50 @@
+from tests.base import DatabaseTestCase,User,Order
+
+
+class LimitTest(DatabaseTestCase):
+
+    def test_get_limit_2(self):
+        with self.capture() as queries:
+            user = User.object.get(name="u1")
+        self.assertEqual(user.name,"u1")
+        self.assertEqual(len(queries),1)
+        self.assertTrue(queries[0].endswith("LIMIT 2 OFFSET 0 ;"),queries[0])
+
+    def test_get_multi_result(self):
+        with self.capture() as queries:
+            with self.assertRaises(User.MultiResult):
+                User.object.get(sex="F")
+        self.assertIn("LIMIT 2 OFFSET 0",queries[0])
+
+    def test_exists(self):
+        with self.capture() as queries:
+            self.assertTrue(User.object.query(sex="F").exists())
+            self.assertFalse(User.object.query(name="none").exists())
+        self.assertEqual(queries[0],"SELECT 1 FROM `User` WHERE `sex` = ? LIMIT 1 OFFSET 0 ;")
+        self.assertEqual(len(queries),2)
+
+    def test_bool(self):
+        with self.capture() as queries:
+            self.assertTrue(User.object.query(sex="M"))
+        self.assertEqual(queries,["SELECT 1 FROM `User` WHERE `sex` = ? LIMIT 1 OFFSET 0 ;"])
+
+    def test_first(self):
+        with self.capture() as queries:
+            order = Order.object.all().sort("amount").first()
+        self.assertEqual(order.amount,0)
+        self.assertTrue(queries[0].endswith("ORDER BY `amount` LIMIT 1 OFFSET 0 ;"),queries[0])
+
+    def test_last(self):
+        with self.capture() as queries:
+            order = Order.object.all().sort("amount").last()
+            user = User.object.all().last()
+        self.assertEqual(order.amount,9)
+        self.assertEqual(user.name,"u4")
+        self.assertTrue(queries[0].endswith("ORDER BY `amount` DESC LIMIT 1 OFFSET 0 ;"),queries[0])
+        self.assertTrue(queries[1].endswith("ORDER BY `id` DESC LIMIT 1 OFFSET 0 ;"),queries[1])
+
+    def test_slice(self):
+        with self.capture() as queries:
+            orders = Order.object.all().sort("amount")[2:5]
+        self.assertEqual([order.amount for order in orders],[2,3,4])
+        self.assertTrue(queries[0].endswith("LIMIT 3 OFFSET 2 ;"),queries[0])
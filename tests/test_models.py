@@ -0,0 +1,32 @@
+import unittest
+import ormlite
+from ormlite.exception import ModelException
+
+
+class Account(ormlite.Model):
+    id = ormlite.PrimaryKey()
+    name = ormlite.CharField(max_length=50)
+
+    def transfer_log(self):
+        return []
+
+
+class RelatedNameTest(unittest.TestCase):
+
+    def test_duplicate_reverse_name(self):
+        with self.assertRaisesRegex(ModelException,"related_name"):
+            class Transfer(ormlite.Model):
+                sender = ormlite.ForeignKey(Account,on_delete=ormlite.CASCADE)
+                receiver = ormlite.ForeignKey(Account,on_delete=ormlite.CASCADE)
+
+    def test_reverse_name_clashes_with_attribute(self):
+        with self.assertRaisesRegex(ModelException,"related_name"):
+            class TransferLog(ormlite.Model):
+                account = ormlite.ForeignKey(Account,on_delete=ormlite.CASCADE,related_name="transfer_log")
+
+    def test_related_name(self):
+        class Payment(ormlite.Model):
+            payer = ormlite.ForeignKey(Account,on_delete=ormlite.CASCADE,related_name="payments_made")
+            payee = ormlite.ForeignKey(Account,on_delete=ormlite.CASCADE,related_name="payments_received")
+        self.assertIs(Account._opts.reverse_related["payments_made"],Payment._opts.field_map["payer"])
+        self.assertIs(Account._opts.reverse_related["payments_received"],Payment._opts.field_map["payee"])
@@ -0,0 +1,143 @@
+import threading
+import time
+import unittest
+from ormlite.db.pool import ConnectionPool
+from ormlite.exception import PoolTimeout
+
+
+class FakeConnection(object):
+
+    def __init__(self,number):
+        self.number = number
+        self.usable = True
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class PoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.connections = []
+
+    def connect(self):
+        connection = FakeConnection(len(self.connections))
+        self.connections.append(connection)
+        return connection
+
+    def is_usable(self,connection):
+        return connection.usable
+
+    def get_pool(self,**kwargs):
+        return ConnectionPool(self.connect,is_usable=self.is_usable,**kwargs)
+
+    def test_reuse(self):
+        pool = self.get_pool(min_size=1,max_size=2)
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIs(pool.acquire(),connection)
+        self.assertEqual(len(self.connections),1)
+
+    def test_timeout(self):
+        pool = self.get_pool(max_size=1,timeout=0.05)
+        pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        stats = pool.stats()
+        self.assertEqual((stats["waits"],stats["timeouts"],stats["in_use"]),(1,1,1))
+        self.assertGreaterEqual(stats["wait_time"],0.05)
+
+    def test_wait_for_release(self):
+        pool = self.get_pool(max_size=1,timeout=5)
+        connection = pool.acquire()
+        timer = threading.Timer(0.05,pool.release,(connection,))
+        timer.start()
+        self.assertIs(pool.acquire(),connection)
+        timer.join()
+        self.assertEqual(pool.stats()["waits"],1)
+
+    def test_recycle(self):
+        pool = self.get_pool(max_size=1,recycle=0.01)
+        connection = pool.acquire()
+        pool.release(connection)
+        time.sleep(0.02)
+        new = pool.acquire()
+        self.assertIsNot(new,connection)
+        self.assertTrue(connection.closed)
+        stats = pool.stats()
+        self.assertEqual((stats["recycled"],stats["closed"],stats["size"]),(1,1,1))
+
+    def test_failed_ping_discards(self):
+        pool = self.get_pool(max_size=1)
+        connection = pool.acquire()
+        pool.release(connection)
+        connection.usable = False
+        new = pool.acquire()
+        self.assertIsNot(new,connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()["failed_pings"],1)
+
+    def test_no_pre_ping(self):
+        pool = self.get_pool(max_size=1,pre_ping=False)
+        connection = pool.acquire()
+        pool.release(connection)
+        connection.usable = False
+        self.assertIs(pool.acquire(),connection)
+
+    def test_failed_connect_frees_slot(self):
+        def connect():
+            raise OSError("refused")
+        pool = ConnectionPool(connect,max_size=1,timeout=0.05)
+        for _ in range(2):
+            with self.assertRaises(OSError):
+                pool.acquire()
+        self.assertEqual(pool.stats()["size"],0)
+
+    def test_thread_affinity(self):
+        #每个线程优先取回自己上次使用的连接
+        pool = self.get_pool(max_size=2)
+        mine = pool.acquire()
+        acquired = []
+        released = threading.Event()
+        def other():
+            connection = pool.acquire()
+            acquired.append(connection)
+            released.wait()
+            pool.release(connection)
+        thread = threading.Thread(target=other)
+        thread.start()
+        while not acquired:
+            time.sleep(0.001)
+        pool.release(mine)
+        released.set()
+        thread.join()
+        self.assertIs(pool.acquire(),mine)
+        self.assertIsNot(acquired[0],mine)
+
+    def test_release_discard(self):
+        pool = self.get_pool(max_size=2)
+        connection = pool.acquire()
+        pool.release(connection,discard=True)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()["size"],0)
+
+    def test_stats(self):
+        pool = self.get_pool(min_size=1,max_size=3)
+        first = pool.acquire()
+        second = pool.acquire()
+        pool.release(first)
+        stats = pool.stats()
+        self.assertEqual((stats["size"],stats["idle"],stats["in_use"]),(2,1,1))
+        self.assertEqual((stats["created"],stats["checkouts"]),(2,2))
+        self.assertEqual((stats["min_size"],stats["max_size"]),(1,3))
+        pool.release(second)
+        pool.close()
+        stats = pool.stats()
+        self.assertEqual((stats["size"],stats["closed"]),(0,2))
+
+    def test_invalid_size(self):
+        with self.assertRaises(ValueError):
+            self.get_pool(max_size=0)
+        with self.assertRaises(ValueError):
+            self.get_pool(min_size=2,max_size=1)
@@ -0,0 +1,46 @@
+from tests.base import DatabaseTestCase,User,Order
+
+
+class SaveTest(DatabaseTestCase):
+
+    def test_save_deferred_instance(self):
+        order = Order.object.all().only("amount").sort("id").first()
+        with self.capture() as queries:
+            order.amount = 99
+            order.save()
+        self.assertEqual(queries,["UPDATE `Order` SET `amount` = ? WHERE `id` = ? ;"])
+        self.assertEqual(Order.object.get(id=order.id).amount,99)
+
+    def test_save_after_create(self):
+        user = User.object.create(name="n1",sex="M")
+        with self.capture() as queries:
+            user.name = "n2"
+            user.save()
+            user.save()
+        self.assertEqual(queries,["UPDATE `User` SET `name` = ? WHERE `id` = ? ;"])
+
+    def test_save_after_bulk_create(self):
+        users = User.object.bulk_create([User(name="a",sex="M"),User(name="b",sex="F")])
+        with self.capture() as queries:
+            users[1].sex = "M"
+            users[1].save()
+        self.assertEqual(queries,["UPDATE `User` SET `sex` = ? WHERE `id` = ? ;"])
+        self.assertEqual(User.object.get(id=users[1].id).sex,"M")
+
+    def test_save_fields_without_snapshot(self):
+        user = User(id=2,name="changed",sex="M")
+        user.save(fields=["sex"])
+        self.assertEqual(User.object.get(id=2).name,"u1")
+        with self.capture() as queries:
+            user.save()
+        self.assertEqual(len(queries),1)
+        self.assertEqual(User.object.get(id=2).name,"changed")
+        self.assertEqual(User.object.get(id=2).sex,"M")
+
+    def test_bulk_update_without_snapshot(self):
+        users = [User(id=1,name="x1",sex="F"),User(id=2,name="x2",sex="F")]
+        User.object.bulk_update(users,["sex"])
+        self.assertEqual(User.object.get(id=2).name,"u1")
+        self.assertEqual(User.object.get(id=2).sex,"F")
+        users[1].save()
+        self.assertEqual(User.object.get(id=2).name,"x2")